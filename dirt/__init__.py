@@ -1 +1,5 @@
-from .dirt import main
+def main():
+    # The game is only imported when it is run, so that importing a
+    # submodule such as dirt.mapformat does not pull in all of it.
+    from .dirt import main
+    main()
@@ -0,0 +1,77 @@
+"""
+The assetcache module keeps decoded images and sounds around for reuse.
+"""
+from collections import OrderedDict
+
+class AssetCache(object):
+    """
+    An AssetCache maps keys to decoded assets, such as images and sounds,
+    so that they only have to be decoded once.
+
+    The cache keeps track of roughly how many bytes its assets take up.
+    Once that goes over *max_bytes*, the least recently used assets are
+    evicted.  Evicted assets stay alive for as long as something else
+    uses them; the cache just forgets about them.
+
+    :ivar int max_bytes: how many bytes of assets to keep
+    :ivar int total_bytes: how many bytes of assets are being kept
+    :ivar int hits: how many lookups found their asset in the cache
+    :ivar int misses: how many lookups had to load their asset
+    :ivar int evictions: how many assets have been evicted
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        """Create a new, empty AssetCache."""
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Maps each key to a tuple (asset, size), from least to most
+        # recently used.
+        self.entries = OrderedDict()
+
+    def get(self, key, load, size_of):
+        """
+        Return the asset for KEY, calling LOAD() to load it if it is not
+        in the cache.  SIZE_OF(asset) must return the asset's size in bytes.
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+
+        self.misses += 1
+        asset = load()
+        self.put(key, asset, size_of(asset))
+        return asset
+
+    def put(self, key, asset, size):
+        "Store ASSET, which is SIZE bytes big, in the cache under KEY."
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.total_bytes -= old[1]
+
+        self.entries[key] = (asset, size)
+        self.total_bytes += size
+
+        # Evict the least recently used assets, but never the new one.
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self.evictions += 1
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def clear(self):
+        "Forget all assets."
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def stats(self):
+        "Return a one-line summary of how the cache is doing."
+        return '%d assets, %d KiB, %d hits, %d misses, %d evictions' % \
+               (len(self.entries), self.total_bytes // 1024,
+                self.hits, self.misses, self.evictions)
@@ -0,0 +1,411 @@
+"""
+The batchsim module plays many game sessions at once, for balancing.
+
+Rather than stepping one :class:`dirt.game.GameState` at a time, a
+:class:`BatchSimulation` keeps the health, money, position and clock of
+every session in NumPy arrays and advances all of them in lock-step, so
+that sweeps over millions of sessions finish in seconds:
+
+    sim = BatchSimulation(world, tile_kinds, 1000000, seed=1)
+    sim.run(2000)
+    print(sim.stats()['survival_rate'])
+
+Each session plays by a simple script.  Outside of battle, the player
+walks forward, turning left or right at random whenever a wall is in
+the way.  In battle, the player follows the simulation's policy:
+
+* :data:`POLICY_FIGHT` attacks until the enemy is dead.
+* :data:`POLICY_TALK` takes the quickest peaceful way out of the battle
+  that the enemy's options offer, such as giving the advice, donating,
+  or biding and backing away.  Enemies without one are fought.
+
+The monsters, their stats and the weighted encounter tables of each
+tile come from the registered mods (see :mod:`dirt.monsters.templates`),
+so :func:`dirt.game.load_mods` must be called first.  The peaceful way
+out of a battle with each monster is worked out once, by playing its
+options headless.  The outcome of each battle round follows the rules
+in :mod:`dirt.game`.  Flavour that does not change the numbers, such as
+what the monsters say, is left out.
+
+NumPy is only needed by this module, not by the game itself.
+"""
+import random
+import numpy as np
+from . import utils
+from .game import NORTH, EAST, SOUTH, WEST, NUM_DIRS, DAY_LENGTH, \
+     SAFE_TILE, ENCOUNTER_ODDS, Player, dir_as_offset
+from .monsters.templates import OP_GAIN_MONEY, DEFAULT_ENCOUNTERS, \
+     monster_templates, encounter_tables, tile_encounters
+
+# What the player does in battle.
+POLICY_FIGHT = 'fight'
+POLICY_TALK  = 'talk'
+
+# How many options the player tries in a row when looking for the
+# peaceful way out of a battle.
+MAX_PEACEFUL_OPTIONS = 3
+
+# No enemy: the session is not in battle.
+_NO_ENEMY = -1
+
+# The options which every monster has, and which are not peaceful.
+_COMBAT_OPTIONS = ('Attack', 'Ignore')
+
+# The health of the player who tries out the options of monsters.
+_PROBE_HEALTH = 1000.0
+
+def peaceful_exit(template):
+    """
+    Find the quickest peaceful way out of a battle with a monster, by
+    playing its options headless.
+
+    :param template: the :class:`dirt.monsters.templates.MonsterTemplate`
+                     of the monster
+    :returns: a tuple (options, minutes, damage, money) of the options
+              to choose, how many minutes they take, how much of the
+              player's health they cost and how much money the player
+              gives away, or None if the monster cannot be talked down
+    """
+    names = []
+    for name, condition, negated, program in template.options:
+        if name not in names and name not in _COMBAT_OPTIONS:
+            names.append(name)
+
+    # The monster is played without its sprite, voice and sounds.
+    media_enabled = utils.media_enabled
+    utils.media_enabled = False
+    try:
+        # Try every sequence of options, shortest first.
+        sequences = [()]
+        for length in range(MAX_PEACEFUL_OPTIONS):
+            longer = []
+            for sequence in sequences:
+                for name in names:
+                    result = _play_options(template, sequence + (name,))
+                    if result is not None:
+                        return result
+                    longer.append(sequence + (name,))
+            sequences = longer
+        return None
+    finally:
+        utils.media_enabled = media_enabled
+
+def _play_options(template, options):
+    """
+    Play OPTIONS against a new monster made from TEMPLATE, and return
+    what :func:`peaceful_exit` returns if that ends the battle, or None.
+    """
+    from .monsters.monster import Monster
+
+    monster = Monster(template, random.Random(0))
+    player = Player(0, 0)
+    player.health = player.max_health = _PROBE_HEALTH
+    player.money = 1
+
+    minutes = 0
+    for option in options:
+        if option not in monster.get_options(player):
+            return None
+        monster.suffer(player, option)
+
+        # Time passing lets the monster strike, as in GameState.update.
+        if player.time_has_passed():
+            player.stop_time()
+            minutes += 1
+            monster.engage(player)
+
+        if monster.combativeness.is_dead():
+            return None
+        if monster.combativeness.is_done():
+            return options, minutes, _PROBE_HEALTH - player.health, 1 - player.money
+    return None
+
+def _reward_range(template):
+    "Return the least and the most money that beating a monster pays."
+    low = high = 0
+    for opcode, arg in template.reward:
+        if opcode == OP_GAIN_MONEY:
+            low += arg[0]
+            high += arg[1]
+    return low, high
+
+class BatchSimulation(object):
+    """
+    A BatchSimulation plays many independent sessions of the game.
+
+    :ivar int count: how many sessions there are
+    :ivar str policy: what the player does in battle
+    :ivar int steps: how many steps have been taken
+    :ivar position: the tile index of the player in each session
+    :ivar facing: the direction the player faces in each session
+    :ivar health: the player's health in each session
+    :ivar money: the player's money in each session
+    :ivar minutes: how many minutes each session has lasted
+    :ivar alive: whether the player is alive in each session
+    :ivar list names: the names of the monsters that can be met
+    :ivar enemy: the index in *names* of the monster being fought in
+                 each session, or -1
+    :ivar battles: how many battles each session has had
+    :ivar killer: the monster who killed the player in each session, or -1
+    """
+    def __init__(self, world, tile_kinds, count, x=12, y=16, facing=SOUTH,
+                 health=3, money=3, time=60 * 5, policy=POLICY_FIGHT,
+                 seed=None, templates=None, tables=None, tile_tables=None):
+        """
+        Create a new BatchSimulation.
+
+        :param world: the :class:`dirt.world.World` to play in
+        :param dict tile_kinds: the :class:`dirt.game.TileKind` of each
+                                tile number
+        :param int count: how many sessions to play
+        :param int x: the x position the player starts at
+        :param int y: the y position the player starts at
+        :param int facing: the direction the player starts facing
+        :param health: the health the player starts with
+        :param int money: the money the player starts with
+        :param int time: the minute of the day the sessions start at
+        :param str policy: what the player does in battle
+        :param seed: the seed of the random number generator
+        :param dict templates: the monsters that can be met, by name;
+                               by default, those of the registered mods
+        :param dict tables: the encounter tables, by name; by default,
+                            those of the registered mods
+        :param dict tile_tables: the name of the encounter table of each
+                                 tile number that does not use the
+                                 default one; by default, as the
+                                 registered mods say
+        """
+        if policy not in (POLICY_FIGHT, POLICY_TALK):
+            raise ValueError('Unknown battle policy: %s' % policy)
+
+        if templates is None:
+            templates = monster_templates
+        if tables is None:
+            tables = encounter_tables
+        if tile_tables is None:
+            tile_tables = tile_encounters
+
+        self.count = count
+        self.policy = policy
+        self.steps = 0
+        self.rng = np.random.default_rng(seed)
+
+        # Positions are kept as tile indices, row by row.  For each
+        # position and direction, work out once where walking leads:
+        # the index of the tile in front, or -1 if it is blocked.  Tiles
+        # without a kind are treated as walls.
+        self.width = world.width
+        self.height = world.height
+        tiles = np.frombuffer(bytes(world.tiles[:len(world.tiles)]),
+                              dtype=np.uint8)
+        solid = np.ones(256, dtype=bool)
+        for num, kind in tile_kinds.items():
+            solid[num] = kind.is_solid
+
+        xs = np.arange(len(tiles)) % self.width
+        ys = np.arange(len(tiles)) // self.width
+        self.ahead = np.empty((len(tiles), NUM_DIRS), dtype=np.int32)
+        for direction in (NORTH, EAST, SOUTH, WEST):
+            dx, dy = dir_as_offset(direction)
+            tx = xs + dx
+            ty = ys + dy
+            inside = (tx >= 0) & (tx < self.width) & \
+                     (ty >= 0) & (ty < self.height)
+            target = np.where(inside, ty * self.width + tx, 0)
+            self.ahead[:, direction] = np.where(
+                inside & ~solid[tiles[target]], target, -1)
+
+        # Work out the chances of meeting each monster under each
+        # encounter table, and which table is used on each tile: the
+        # index of its chances, or -1 if nothing is met there.
+        self.names = list(templates)
+        self.encounter_chances = []
+        table_indices = {}
+        tile_table = np.full(256, -1, dtype=np.int16)
+        for num in range(256):
+            name = tile_tables.get(num, DEFAULT_ENCOUNTERS)
+            if num == SAFE_TILE or name not in tables:
+                continue
+
+            if name not in table_indices:
+                weights = np.zeros(len(self.names))
+                for monster, weight in zip(tables[name].names,
+                                           tables[name].weights):
+                    if monster not in templates:
+                        raise ValueError('Unknown monster in encounter table %s: %s'
+                                         % (name, monster))
+                    weights[self.names.index(monster)] += weight
+
+                if weights.sum() > 0:
+                    table_indices[name] = len(self.encounter_chances)
+                    self.encounter_chances.append(weights / weights.sum())
+                else:
+                    table_indices[name] = -1
+            tile_table[num] = table_indices[name]
+        self.encounter_table = tile_table[tiles]
+
+        # The stats of each monster, and what talking it down or beating
+        # it does.  Monsters that cannot be talked down are fought.
+        monsters = [templates[name] for name in self.names]
+        exits = [peaceful_exit(template) if policy == POLICY_TALK else None
+                 for template in monsters]
+        rewards = [_reward_range(template) for template in monsters]
+
+        self.enemy_power = np.array([t.power for t in monsters], dtype=np.float64)
+        self.enemy_max_health = np.array([t.health for t in monsters],
+                                         dtype=np.float64)
+        self.can_talk = np.array([e is not None for e in exits], dtype=bool)
+        self.talk_minutes = np.array([e[1] if e else 0 for e in exits],
+                                     dtype=np.int64)
+        self.talk_damage = np.array([e[2] if e else 0 for e in exits],
+                                    dtype=np.float64)
+        self.talk_money = np.array([e[3] if e else 0 for e in exits],
+                                   dtype=np.int64)
+        self.reward_low = np.array([r[0] for r in rewards], dtype=np.int64)
+        self.reward_high = np.array([r[1] for r in rewards], dtype=np.int64)
+
+        self.start_time = time
+        self.position = np.full(count, y * self.width + x, dtype=np.int32)
+        self.facing = np.full(count, facing, dtype=np.int8)
+        self.health = np.full(count, health, dtype=np.float64)
+        self.money = np.full(count, money, dtype=np.int64)
+        self.minutes = np.zeros(count, dtype=np.int64)
+        self.alive = np.ones(count, dtype=bool)
+        self.enemy = np.full(count, _NO_ENEMY, dtype=np.int16)
+        self.enemy_health = np.zeros(count, dtype=np.float64)
+        self.battles = np.zeros(count, dtype=np.int32)
+        self.killer = np.full(count, _NO_ENEMY, dtype=np.int16)
+
+        # How many times each monster has been met.
+        self.encounters = np.zeros(len(self.names), dtype=np.int64)
+
+    @property
+    def x(self):
+        "The x position of the player in each session."
+        return self.position % self.width
+
+    @property
+    def y(self):
+        "The y position of the player in each session."
+        return self.position // self.width
+
+    @property
+    def time(self):
+        "The current minute of the day in each session."
+        return (self.start_time + self.minutes) % DAY_LENGTH
+
+    def _walk(self, ids):
+        "Walk the players of the sessions IDS, meeting monsters on the way."
+        target = self.ahead[self.position[ids], self.facing[ids]]
+        moves = target >= 0
+
+        # Turn left or right when the way is blocked.
+        blocked = ids[~moves]
+        turns = self.rng.integers(0, 2, size=len(blocked)) * 2 - 1
+        self.facing[blocked] = (self.facing[blocked] + turns) % NUM_DIRS
+
+        movers = ids[moves]
+        target = target[moves]
+        self.position[movers] = target
+        self.minutes[movers] += 1
+
+        # Start random encounters, randomly, with monsters chosen by the
+        # encounter table of the tile.
+        rolls = self.rng.random(len(movers), dtype=np.float32)
+        tables = self.encounter_table[target]
+        meeting = (tables >= 0) & (rolls * ENCOUNTER_ODDS < 1)
+        met = movers[meeting]
+        tables = tables[meeting]
+
+        kinds = np.empty(len(met), dtype=np.int64)
+        for table, chances in enumerate(self.encounter_chances):
+            here = tables == table
+            kinds[here] = self.rng.choice(len(self.names), size=int(here.sum()),
+                                          p=chances)
+        self.enemy[met] = kinds
+        self.enemy_health[met] = self.enemy_max_health[kinds]
+        self.battles[met] += 1
+        self.encounters += np.bincount(kinds, minlength=len(self.names))
+
+    def _fight(self, ids):
+        "Play one round of the battles of the sessions IDS."
+        kinds = self.enemy[ids]
+        if self.policy == POLICY_TALK:
+            talking = self.can_talk[kinds]
+        else:
+            talking = np.zeros(len(ids), dtype=bool)
+
+        # Every attack that does not kill the enemy is answered twice:
+        # once right away and once as time passes.  Even the killing
+        # blow is answered once.
+        fighters = ids[~talking]
+        fought = kinds[~talking]
+        self.enemy_health[fighters] -= 1
+        killed = self.enemy_health[fighters] <= 0
+        self.health[fighters] -= self.enemy_power[fought] * np.where(killed, 1, 2)
+        self.minutes[fighters] += 1
+
+        # Talking the enemy down takes the whole peaceful way out at once.
+        talkers = ids[talking]
+        talked = kinds[talking]
+        self.health[talkers] -= self.talk_damage[talked]
+        self.minutes[talkers] += self.talk_minutes[talked]
+        self.money[talkers] = np.maximum(0, self.money[talkers] - self.talk_money[talked])
+
+        ended = np.concatenate((fighters[killed], talkers))
+
+        # The dead stay dead.
+        dead = self.health[ids] <= 0
+        self.alive[ids[dead]] = False
+        self.killer[ids[dead]] = kinds[dead]
+
+        # End the battles, and let the enemies who reward the player pay out.
+        ended = ended[self.alive[ended]]
+        beaten = self.enemy[ended]
+        paying = self.reward_high[beaten] > 0
+        self.money[ended[paying]] += self.rng.integers(
+            self.reward_low[beaten[paying]], self.reward_high[beaten[paying]] + 1)
+        self.enemy[ended] = _NO_ENEMY
+
+    def step(self):
+        "Advance every session that is still going by one action."
+        in_battle = self.enemy != _NO_ENEMY
+        fighting = np.flatnonzero(self.alive & in_battle)
+        walking = np.flatnonzero(self.alive & ~in_battle)
+
+        self._fight(fighting)
+        self._walk(walking)
+        self.steps += 1
+
+    def run(self, steps):
+        "Take up to STEPS steps, stopping early once every player is dead."
+        for _ in range(steps):
+            if not self.alive.any():
+                break
+            self.step()
+
+    def stats(self):
+        """
+        Return statistics about the sessions so far.
+
+        :returns: a dict of the number of ``sessions`` and ``survivors``,
+                  the ``survival_rate``, the ``mean_minutes`` played and
+                  ``mean_battles`` fought per session, the
+                  ``mean_money`` of the survivors, and the number of
+                  ``encounters`` and ``deaths`` by each monster's name
+        """
+        survivors = int(self.alive.sum())
+        deaths = np.bincount(self.killer[~self.alive].astype(np.int64),
+                             minlength=len(self.names))
+
+        return {
+            'sessions': self.count,
+            'survivors': survivors,
+            'survival_rate': survivors / float(self.count),
+            'mean_minutes': float(self.minutes.mean()),
+            'mean_battles': float(self.battles.mean()),
+            'mean_money': float(self.money[self.alive].mean())
+                          if survivors else 0.0,
+            'encounters': dict(zip(self.names, self.encounters.tolist())),
+            'deaths': dict(zip(self.names, deaths.tolist())),
+        }
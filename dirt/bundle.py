@@ -0,0 +1,129 @@
+"""
+The bundle module reads mods which are packed into a single file.
+
+A mod bundle is a zip archive (named ``<mod name>.dirtpak``) holding the
+same files as a mod directory, such as ``config.json`` and ``data/...``.
+The archive's central directory serves as the index of its members.
+Members should be stored without compression: the bundle is
+memory-mapped, and stored members are read straight out of the mapping
+without copying them.  Compressed members still work, but they are
+decompressed into memory whenever they are opened.
+
+Bundles can be made from mod directories with :func:`pack_mod`.
+"""
+import io
+import mmap
+import os
+import struct
+import zipfile
+
+# The file extension of mod bundles.
+BUNDLE_EXTENSION = '.dirtpak'
+
+# The fixed-size part of a zip file's local file header.
+_local_header = struct.Struct('<4s22xHH')
+_LOCAL_HEADER_MAGIC = b'PK\x03\x04'
+
+class MemberStream(io.RawIOBase):
+    """
+    A read-only, seekable stream over a memoryview of a bundle member.
+    """
+    def __init__(self, view):
+        self.view = view
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), len(self.view) - self.pos)
+        b[:n] = self.view[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self.view) - self.pos
+        data = self.view[self.pos:self.pos + size].tobytes()
+        self.pos += len(data)
+        return data
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += len(self.view)
+        if offset < 0:
+            raise ValueError('negative seek position %d' % offset)
+        self.pos = offset
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+class ModBundle(object):
+    """
+    A ModBundle gives access to the members of a mod bundle.
+
+    :ivar str path: the path to the bundle
+    """
+    def __init__(self, path):
+        """Open the mod bundle at PATH and read its index."""
+        self.path = path
+        self.zip = zipfile.ZipFile(path)
+
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # Maps the name of each stored member to its (offset, size)
+        # in the bundle.
+        self.stored = {}
+
+        # The names of all members.
+        self.names = []
+
+        for info in self.zip.infolist():
+            if info.filename.endswith('/'):
+                continue
+
+            self.names.append(info.filename)
+
+            if info.compress_type == zipfile.ZIP_STORED:
+                magic, name_len, extra_len = _local_header.unpack_from(
+                    self.map, info.header_offset)
+                if magic != _LOCAL_HEADER_MAGIC:
+                    raise ValueError('Corrupt mod bundle: %s' % path)
+
+                offset = info.header_offset + _local_header.size + \
+                         name_len + extra_len
+                self.stored[info.filename] = (offset, info.file_size)
+
+    def read(self, name):
+        """
+        Return the contents of the member NAME.
+
+        Stored members are returned as a memoryview of the bundle.
+        """
+        member = self.stored.get(name)
+        if member is None:
+            return memoryview(self.zip.read(name))
+
+        offset, size = member
+        return memoryview(self.map)[offset:offset + size]
+
+    def open(self, name):
+        "Return a read-only stream to the member NAME."
+        return MemberStream(self.read(name))
+
+def pack_mod(mod_dir, bundle_path):
+    "Pack the mod directory MOD_DIR into a new bundle at BUNDLE_PATH."
+    with zipfile.ZipFile(bundle_path, 'w', zipfile.ZIP_STORED) as z:
+        for dirpath, dirnames, filenames in os.walk(mod_dir):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                full_path = os.path.join(dirpath, filename)
+                name = os.path.relpath(full_path, mod_dir)
+                z.write(full_path, name.replace(os.sep, '/'))
@@ -0,0 +1,165 @@
+"""
+The chunks module streams the tiles of very large maps.
+"""
+from collections import OrderedDict
+
+class ChunkedTiles(object):
+    """
+    ChunkedTiles stores the tiles of a map in square chunks which are
+    only loaded when they are used.
+
+    It behaves like the flat, row-by-row list of tiles that
+    :class:`dirt.world.World` expects: it can be indexed and sliced
+    with tile indices, assigned to and iterated over.
+
+    Chunks are copied out of a source buffer (such as a memory-mapped
+    map file) when a tile in them is first used, and are evicted again,
+    least recently used first, once they take up more than
+    *cache_bytes*.  Chunks which have been changed are never evicted,
+    since the source cannot be written to.
+
+    :ivar int width: the width of the map
+    :ivar int height: the height of the map
+    :ivar int chunk_size: the width and height of each chunk
+    :ivar int cache_bytes: how many bytes of unchanged chunks to keep
+    """
+    def __init__(self, width, height, source=None, chunk_size=64,
+                 cache_bytes=16 * 1024 * 1024):
+        """
+        Create a new ChunkedTiles object.
+
+        :param int width: the width of the map
+        :param int height: the height of the map
+        :param source: a buffer of tiles, row by row, or None to start
+                       with every tile set to 0
+        :param int chunk_size: the width and height of each chunk
+        :param int cache_bytes: how many bytes of unchanged chunks to keep
+        """
+        self.width = width
+        self.height = height
+        self.source = source
+        self.chunk_size = chunk_size
+        self.cache_bytes = cache_bytes
+
+        # Unchanged chunks, from least to most recently used.
+        self.cache = OrderedDict()
+
+        # Changed chunks.
+        self.dirty = {}
+
+    def __len__(self):
+        return self.width * self.height
+
+    def _read_chunk(self, cx, cy):
+        "Copy the chunk at chunk position (CX, CY) out of the source."
+        size = self.chunk_size
+        chunk = bytearray(size * size)
+
+        if self.source is not None:
+            x = cx * size
+            w = min(size, self.width - x)
+            for row in range(min(size, self.height - cy * size)):
+                start = (cy * size + row) * self.width + x
+                chunk[row * size:row * size + w] = self.source[start:start + w]
+
+        return chunk
+
+    def _find_chunk(self, cx, cy):
+        "Return the chunk at chunk position (CX, CY) if it is resident."
+        key = (cx, cy)
+        chunk = self.dirty.get(key)
+        if chunk is None:
+            chunk = self.cache.get(key)
+        return chunk
+
+    def _get_chunk(self, cx, cy):
+        "Return the chunk at chunk position (CX, CY), loading it if needed."
+        key = (cx, cy)
+        chunk = self.dirty.get(key)
+        if chunk is not None:
+            return chunk
+
+        chunk = self.cache.get(key)
+        if chunk is not None:
+            self.cache.move_to_end(key)
+            return chunk
+
+        chunk = self._read_chunk(cx, cy)
+        self.cache[key] = chunk
+
+        # Evict the least recently used chunks.
+        chunk_bytes = self.chunk_size * self.chunk_size
+        while len(self.cache) > 1 and \
+              len(self.cache) * chunk_bytes > self.cache_bytes:
+            self.cache.popitem(last=False)
+
+        return chunk
+
+    def _locate(self, index):
+        "Return (cx, cy, offset) for the tile at INDEX."
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('tile index out of range')
+
+        y, x = divmod(index, self.width)
+        cy, oy = divmod(y, self.chunk_size)
+        cx, ox = divmod(x, self.chunk_size)
+        return cx, cy, oy * self.chunk_size + ox
+
+    def _read_span(self, start, stop):
+        "Return the tiles from START to STOP without caching any chunks."
+        size = self.chunk_size
+        tiles = bytearray()
+        index = start
+
+        while index < stop:
+            y, x = divmod(index, self.width)
+            cy, oy = divmod(y, size)
+            cx, ox = divmod(x, size)
+
+            # Read up to the end of the row, the chunk or the span.
+            n = min(size - ox, self.width - x, stop - index)
+            chunk = self._find_chunk(cx, cy)
+            if chunk is not None:
+                offset = oy * size + ox
+                tiles += chunk[offset:offset + n]
+            elif self.source is not None:
+                tiles += self.source[index:index + n]
+            else:
+                tiles += bytes(n)
+            index += n
+
+        return tiles
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            tiles = self._read_span(start, max(start, stop))
+            if step != 1:
+                tiles = tiles[::step]
+            return tiles
+
+        cx, cy, offset = self._locate(index)
+        return self._get_chunk(cx, cy)[offset]
+
+    def __setitem__(self, index, num):
+        cx, cy, offset = self._locate(index)
+        key = (cx, cy)
+        chunk = self._get_chunk(cx, cy)
+        chunk[offset] = num
+
+        # Changed chunks stay in memory for good.
+        if key in self.cache:
+            del self.cache[key]
+            self.dirty[key] = chunk
+
+    def __iter__(self):
+        for y in range(self.height):
+            start = y * self.width
+            for num in self._read_span(start, start + self.width):
+                yield num
+
+    def tolist(self):
+        "Return all of the tiles as a list."
+        return list(self)
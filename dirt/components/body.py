@@ -1,9 +1,14 @@
-import pygame
+from dirt import utils
 from dirt.utils import load_image
 
 class BodyComponent:
+    __slots__ = ('sprite',)
+
     def __init__(self, path=''):
-        self.sprite = load_image(path)
+        if utils.media_enabled:
+            self.sprite = load_image(path)
+        else:
+            self.sprite = None
 
     def draw(self, window):
         window.blit(self.sprite, (0, 0))
@@ -1,22 +1,28 @@
-import pygame
+from dirt import utils
 from dirt.utils import load_sound
 
 class CombatComponent:
+    __slots__ = ('health', 'power', 'ignore_hooks', 'attack_hooks',
+                 'death_hooks', 'surrendered', 'turn_skipped')
+
     blow_fx = None
 
     def __init__(self, health=0, power=0):
-        self.health = health
-        self.power = power
         self.ignore_hooks = []
         self.attack_hooks = []
         self.death_hooks = []
-        self.surrendered = False
-        self.turn_skipped = False
+        self.reset(health, power)
 
-        if CombatComponent.blow_fx is None:
+        if CombatComponent.blow_fx is None and utils.media_enabled:
             CombatComponent.blow_fx = \
               load_sound('data/blow.wav')
 
+    def reset(self, health, power):
+        self.health = health
+        self.power = power
+        self.surrendered = False
+        self.turn_skipped = False
+
     def add_ignore_hook(self, proc):
         self.ignore_hooks += [proc] + self.ignore_hooks
 
@@ -44,7 +50,8 @@ class CombatComponent:
             return
 
         player.take_damage(self.power)
-        CombatComponent.blow_fx.play()
+        if CombatComponent.blow_fx is not None:
+            CombatComponent.blow_fx.play()
 
     def skip_turn(self):
         self.turn_skipped = True
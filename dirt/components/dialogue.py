@@ -1,19 +1,24 @@
-import pygame
+from dirt import utils
 from dirt.utils import draw_text, load_image
 
 class DialogueComponent:
+    __slots__ = ('message_text', 'message_timer', 'closing', 'color',
+                 'start_hooks', 'stop_hooks')
+
     font = None
     bubble_img = None
 
     def __init__(self, color=(0, 0, 0)):
-        self.message_text = ""
-        self.message_timer = 0
-        self.closing = False
         self.color = color
         self.start_hooks = []
         self.stop_hooks = []
+        self.reset()
+
+        if not utils.media_enabled:
+            return
 
         if DialogueComponent.font is None:
+            import pygame
             DialogueComponent.font = \
               pygame.font.Font(None, 15)
 
@@ -21,6 +26,11 @@ class DialogueComponent:
             DialogueComponent.bubble_img = \
               load_image('data/speech_bubble.png')
 
+    def reset(self):
+        self.message_text = ""
+        self.message_timer = 0
+        self.closing = False
+
     def say(self, text):
         self.message_text = text
         self.message_timer = 30
@@ -31,8 +41,11 @@ class DialogueComponent:
         self.say(text)
         self.closing = True
 
+    def is_talking(self):
+        return self.message_timer > 0
+
     def draw(self, window):
-        if self.message_timer > 0:
+        if self.is_talking():
             window.blit(DialogueComponent.bubble_img, (0, 0))
             draw_text(DialogueComponent.font,
                       self.message_text, self.color,
@@ -1,4 +1,6 @@
 import re
+from collections import deque
+from .fuzzy import TrigramIndex
 
 def drop_all(L, elems):
     '''Return a copy of L, dropping all the elements found in elems.
@@ -14,11 +16,74 @@ def drop_all(L, elems):
             new_list.append(obj)
     return new_list
 
+_word_seperator_regex = re.compile('[.!?, ]+')
+
+def clean_player_msg(msg):
+    '''Clean up a piece of player input for ease of processing: make it
+    lowercase, drop punctuation and the word "the", and squeeze spaces.
+    
+    :param str msg: The player input
+    :returns: The cleaned up input
+    :rtype: str
+    '''
+    msg = msg.lower()
+    words = _word_seperator_regex.split(msg)
+    words = drop_all(words, ['the'])
+    msg = ' '.join(words)
+    return msg.strip()
+
+_ask_about_regex = re.compile('^ask ((.+?) )?about (.+)$')
+_what_about_regex = re.compile('^what about (.+)$')
+_know_about_regex = re.compile('^(do you know|i want to know) about (.+)$')
+def extract_topic(msg):
+    '''Find the topic that a piece of cleaned up player input asks about,
+    as in "ASK ABOUT <TOPIC>", "WHAT ABOUT <TOPIC>",
+    "I WANT TO KNOW ABOUT <TOPIC>", or just "<TOPIC>".
+    
+    :param str msg: The player input, cleaned up by :func:`clean_player_msg`
+    :returns: The topic
+    :rtype: str
+    '''
+    m = _ask_about_regex.match(msg)
+    if m:
+        return m.group(3)
+    m = _what_about_regex.match(msg)
+    if m:
+        return m.group(1)
+    m = _know_about_regex.match(msg)
+    if m:
+        return m.group(2)
+    return msg
+
+def typo_tolerance(topic):
+    '''Return how many typos to forgive in a topic that does not match
+    any topic exactly: none in words shorter than six letters, where a
+    typo is as likely to make another ordinary word ("good" is one typo
+    away from "gold"), and more in longer ones.
+    
+    :param str topic: The topic that the player asked about
+    :rtype: int
+    '''
+    if len(topic) < 6:
+        return 0
+    elif len(topic) < 9:
+        return 1
+    return 2
+
 class Verb(object):
     '''A pattern that matches player input and extracts important information.
     
     A convenient subclass is the :class:`SimpleMatchingVerb` class.'''
     
+    def index_keys(self):
+        '''Return the exact inputs that this verb matches, so that
+        conversations can look it up instead of trying it on every input.
+        
+        :returns: A list of the inputs, or None if the verb does more than
+                  match exact inputs and has to be tried every time
+        '''
+        return None
+    
     def match(self, msg):
         '''Attempt to match the player's input.
         
@@ -41,6 +106,9 @@ class SimpleMatchingVerb(Verb):
     def __init__(self, possible_matches):
         self.possible_matches = possible_matches
     
+    def index_keys(self):
+        return self.possible_matches
+    
     def match(self, msg):
         if msg in self.possible_matches:
             return True, [], {}
@@ -55,19 +123,29 @@ class LogEntry(object):
     the *log* instance variable in :class:`Conversation` objects.
     Instead, convenient methods such as :func:`Conversation.log_player_msg`
     are used to add to the log for that particular conversation.
+    
+    :ivar lines: The lines that the entry is displayed as, worked out
+                 once when the entry is made
+    :vartype lines: tuple of (text, color) tuples
     '''
-    pass
+    __slots__ = ('lines',)
+    
+    # The color that the entry is displayed in during a conversation.
+    color = (255, 255, 255)
+    
+    def __str__(self):
+        return '\n'.join(text for text, color in self.lines)
 
 class PlayerMsgLogEntry(LogEntry):
     '''A log entry representing a message from the player.
     
     :ivar str msg: The text of the player's message
     '''
+    __slots__ = ('msg',)
+    
     def __init__(self, msg):
         self.msg = msg
-    
-    def __str__(self):
-        return str(self.msg)
+        self.lines = tuple((line, self.color) for line in str(msg).split('\n'))
 
 class NPCMsgLogEntry(LogEntry):
     '''A log entry representing a message from an NPC.
@@ -75,35 +153,60 @@ class NPCMsgLogEntry(LogEntry):
     :ivar str name: The name of the NPC
     :ivar str msg: The text of the NPC's message
     '''
+    __slots__ = ('name', 'msg')
+    
+    color = (255, 0, 0)
+    
     def __init__(self, name, msg):
         self.name = name
         self.msg = msg
-        
-    def __str__(self):
-        lines = map(lambda s: '%s: %s' % (self.name, s), self.msg.split('\n'))
-        return '\n'.join(lines)
+        self.lines = tuple(('%s: %s' % (name, line), self.color)
+                           for line in msg.split('\n'))
 
 class NarrativeLogEntry(LogEntry):
     '''A log entry representing a passage of text that is not dialogue.
     
     :ivar str msg: The text of the passage
     '''
+    __slots__ = ('msg',)
+    
     def __init__(self, msg):
         self.msg = msg
-    
-    def __str__(self):
-        '''Returns the message stored inside this log entry.'''
-        return str(self.msg)
+        self.lines = tuple((line, self.color) for line in str(msg).split('\n'))
 
 class Rule(object):
     '''A rule for interpreting player input in a conversation. The
-    only rule type is a :class:`TopicRule`.
+    rule types are :class:`TopicRule` and :class:`VerbRule`.
     '''
-    pass
+    
+    def index_keys(self):
+        '''Return the keys under which conversations can look this rule up.
+        
+        :returns: A list of ('topic', topic) and ('msg', msg) tuples for the
+                  topics and cleaned up inputs that activate this rule, or
+                  None if the rule has to be tried on every input
+        '''
+        return None
+    
+    def activate(self, msg, conversation, player):
+        '''Attempts to activate the rule with a piece of player input.
+        
+        :param str msg: The player input
+        :param Conversation conversation: The conversation that this rule belongs to
+        :param dirt.Player player: The player
+        :returns: True if the rule activates successfully, False otherwise
+        :rtype: bool
+        '''
+        msg = clean_player_msg(msg)
+        return self.activate_cleaned(msg, extract_topic(msg), conversation, player)
+    
+    def activate_cleaned(self, msg, topic, conversation, player):
+        '''Like :func:`activate`, but with input that has already been
+        cleaned up by :func:`clean_player_msg` and the topic that
+        :func:`extract_topic` found in it.
+        '''
+        return False
 
-_ask_about_regex = re.compile('^ask ((.+?) )?about (.+)$')
-_what_about_regex = re.compile('^what about (.+)$')
-_know_about_regex = re.compile('^(do you know|i want to know) about (.+)$')
 class TopicRule(Rule):
     '''A topic rule describes a generic topic of conversation. Players
     can type "ASK ABOUT <TOPIC>", "WHAT ABOUT <TOPIC>",
@@ -119,46 +222,16 @@ class TopicRule(Rule):
         self.synonyms = synonyms
         self.callback = callback
     
-    def activate(self, msg, conversation, player):
-        '''Attempts to activate the rule with a piece of player input.
-        
-        :param str msg: The player input
-        :param Conversation conversation: The conversation that this rule belongs to
-        :param dirt.Player player: The player
-        :returns: True if the rule activates successfully, False otherwise
-        :rtype: bool
-        '''
-        # Clean the player input for ease of processing
-        msg = msg.lower()
-        words = _word_seperator_regex.split(msg)
-        words = drop_all(words, ['the'])
-        msg = ' '.join(words)
-        msg = msg.strip()
-        
-        # Try to activate
-        noun = None
-        m = _ask_about_regex.match(msg)
-        if m:
-            noun = m.group(3)
-        else:
-            m = _what_about_regex.match(msg)
-            if m:
-                noun = m.group(1)
-            else:
-                m = _know_about_regex.match(msg)
-                if m:
-                    noun = m.group(2)
-                else:
-                    noun = msg
-        
-        if noun == self.canonical_name or noun in self.synonyms:
+    def index_keys(self):
+        return [('topic', name) for name in (self.canonical_name,) + tuple(self.synonyms)]
+    
+    def activate_cleaned(self, msg, topic, conversation, player):
+        if topic == self.canonical_name or topic in self.synonyms:
             self.callback(conversation, player)
             return True
         
         return False
 
-_word_seperator_regex = re.compile('[.!?, ]+')
-
 class VerbRule(Rule):
     '''A verb rule describes a more freeform command than the topic system.
     With verb rules, you accept more complex commands such as "HEY",
@@ -171,23 +244,13 @@ class VerbRule(Rule):
         self.verb = verb
         self.callback = callback
     
-    def activate(self, msg, conversation, player):
-        '''Attempts to activate the rule with a piece of player input.
-        
-        :param str msg: The player input
-        :param Conversation conversation: The conversation that this rule belongs to
-        :param dirt.Player player: The player object
-        :returns: True if the rule activates successfully, False otherwise
-        :rtype: bool
-        '''
-        # Clean the player input for ease of processing
-        msg = msg.lower()
-        words = _word_seperator_regex.split(msg)
-        words = drop_all(words, ['the'])
-        msg = ' '.join(words)
-        msg = msg.strip()
-        
-        # Try to activate
+    def index_keys(self):
+        msgs = self.verb.index_keys()
+        if msgs is None:
+            return None
+        return [('msg', msg) for msg in msgs]
+    
+    def activate_cleaned(self, msg, topic, conversation, player):
         success, args, kwargs = self.verb.match(msg)
         if success:
             self.callback(conversation, player, *args, **kwargs)
@@ -200,30 +263,86 @@ class Conversation(object):
     conversation.
     
     :ivar str default_npc_name: The default name attached to logged NPC messages
-    :ivar log: The log of messages that have appeared in this conversation
-    :vartype log: list of :class:`LogEntry`
+    :ivar log: The most recent messages that have appeared in this conversation
+    :vartype log: deque of :class:`LogEntry`
+    :ivar display_lines: The most recent lines of the log, as they are displayed
+    :vartype display_lines: deque of (text, color) tuples
     :ivar rules: All the rules governing the conversation
     :vartype rules: list of :class:`Rule`
     :ivar begin_funcs: A list of callbacks that are to be run when conversation begins
     :vartype begin_funcs: list of functions
     '''
-    def __init__(self, default_npc_name):
+    def __init__(self, default_npc_name, log_length=5, display_length=4):
         self.default_npc_name = default_npc_name
-        self.log = []
+        self.log = deque(maxlen=log_length)
+        self.display_lines = deque(maxlen=display_length)
         self.rules = []
         self.begin_funcs = []
+        
+        # Maps the index keys of the rules to the position of the first
+        # rule with each key, and lists the positions of the rules which
+        # cannot be indexed.  Built from the first *_indexed_rules* rules.
+        self._index = {}
+        self._unindexed = []
+        self._indexed_rules = 0
+        
+        # Maps the topics of the rules to the position of the first rule
+        # with each topic, for finding topics with typos in them.
+        self._topics = TrigramIndex()
     
-    def prune_log(self):
-        '''Prunes the log to the most recent 5 messages.'''
-        if len(self.log) > 5:
-            self.log = self.log[-5:]
+    def _index_key(self, key, position):
+        '''Index the rule at *position* under *key*, unless an earlier rule
+        already has the key.'''
+        if key not in self._index:
+            self._index[key] = position
+            if key[0] == 'topic':
+                self._topics.add(key[1], position)
+    
+    def _update_index(self):
+        '''Index the rules that were added since the index was last updated.'''
+        for position in range(self._indexed_rules, len(self.rules)):
+            keys = self.rules[position].index_keys()
+            if keys is None:
+                self._unindexed.append(position)
+            else:
+                for key in keys:
+                    self._index_key(key, position)
+        self._indexed_rules = len(self.rules)
+    
+    def add_rules(self, rules, index=None):
+        '''Adds many rules to the conversation at once.
+        
+        :param rules: The rules to add
+        :type rules: list of :class:`Rule`
+        :param dict index: Optionally, an index of the rules made ahead of
+                           time, which maps the index keys of the rules to
+                           the position of the first rule in *rules* with
+                           each key. Only valid if all the rules can be
+                           indexed.
+        '''
+        if index is None or self._indexed_rules != len(self.rules):
+            self.rules.extend(rules)
+            self._update_index()
+            return
+        
+        offset = len(self.rules)
+        for key, position in index.items():
+            self._index_key(key, position + offset)
+        self.rules.extend(rules)
+        self._indexed_rules = len(self.rules)
+    
+    def append_log(self, entry):
+        '''Appends a :class:`LogEntry` to the log of this conversation,
+        dropping the oldest entries once the log is full.
+        '''
+        self.log.append(entry)
+        self.display_lines.extend(entry.lines)
     
     def log_player_msg(self, msg):
         '''Appends a :class:`PlayerMsgLogEntry` to the log of this
         conversation.
         '''
-        self.log.append(PlayerMsgLogEntry(msg))
-        self.prune_log()
+        self.append_log(PlayerMsgLogEntry(msg))
     
     def log_npc_msg(self, msg, name=None):
         '''Appends a :class:`NPCMsgLogEntry` to the log of this
@@ -231,15 +350,13 @@ class Conversation(object):
         '''
         if name is None:
             name = self.default_npc_name
-        self.log.append(NPCMsgLogEntry(name, msg))
-        self.prune_log()
+        self.append_log(NPCMsgLogEntry(name, msg))
     
     def log_narrative(self, msg):
         '''Appends a :class:`NarrativeLogEntry` to the log of this
         conversation.
         '''
-        self.log.append(NarrativeLogEntry(msg))
-        self.prune_log()
+        self.append_log(NarrativeLogEntry(msg))
     
     def run_begin_funcs(self, player, *args, **kwargs):
         '''Runs all the functions that have been added to this conversation's
@@ -253,15 +370,46 @@ class Conversation(object):
         Typically, this will elicit a response based on the methods
         implemented by this conversation object.
         
-        The message will automatically be logged.
+        The message will automatically be logged. If no rule matches the
+        message, a topic a few typos away from it is looked for.
         
         :param str msg: The user's message
         :param dirt.Player player: The player object
         '''
         self.log_player_msg(msg)
-        for rule in self.rules:
-            if rule.activate(msg, self, player):
+        
+        msg = clean_player_msg(msg)
+        topic = extract_topic(msg)
+        
+        # The first rule that matches wins.  Look up the first indexed rule
+        # that matches, then try the rules that cannot be indexed in front
+        # of it.
+        if len(self.rules) != self._indexed_rules:
+            self._update_index()
+        
+        found = [position for position in (self._index.get(('msg', msg)),
+                                           self._index.get(('topic', topic)))
+                 if position is not None]
+        best = min(found) if found else len(self.rules)
+        
+        for position in self._unindexed:
+            if position > best:
                 break
+            if self.rules[position].activate_cleaned(msg, topic, self, player):
+                return
+        
+        if found:
+            self.rules[best].activate_cleaned(msg, topic, self, player)
+            return
+        
+        # Nothing matched, so maybe the topic has a typo in it.  If it is
+        # close to more than one topic, there is no telling which one the
+        # player meant.
+        closest = self._topics.closest(topic, typo_tolerance(topic),
+                                       unique=True)
+        if closest is not None:
+            name, position = closest
+            self.rules[position].activate_cleaned(msg, name, self, player)
     
     def begin(self, func):
         '''A decorator which adds a callback that runs when conversation begins.'''
@@ -275,6 +423,7 @@ class Conversation(object):
         '''
         def verb_wrapper(func):
             self.rules.append(VerbRule(name, func))
+            self._update_index()
             return func
         
         return verb_wrapper
@@ -288,6 +437,7 @@ class Conversation(object):
         '''
         def topic_wrapper(func):
             self.rules.append(TopicRule(canonical_name, synonyms, func))
+            self._update_index()
             return func
         
         return topic_wrapper
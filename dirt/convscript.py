@@ -0,0 +1,195 @@
+'''Conversation scripts, which let mods add characters to talk to without
+writing any code.
+
+A conversation script is a JSON file like this::
+
+    {
+        "name": "Jyesula",
+        "verbs": {
+            "hello": ["hello", "hi", "hail"]
+        },
+        "begin": [
+            {"when": "throneroom",
+             "do": [{"narrate": "The Chairman acknowledges your presence."}]}
+        ],
+        "rules": [
+            {"verb": "hello", "do": [{"say": "Hail, comrade."}]},
+            {"topic": ["ring", "the ring"], "do": [{"say": "Find it."}]},
+            {"verb": "bye", "do": [{"say": "Farewell."}, {"end": true}]}
+        ]
+    }
+
+*name* is the name that the character's messages are logged under.
+*verbs* defines sets of exact inputs, which are matched like
+:class:`dirt.conversation.SimpleMatchingVerb` matches them. *begin*
+lists what happens when the conversation begins, optionally only
+under some circumstances. *rules* are the topic and verb rules of the
+conversation, in order: the first one that matches the player's input
+wins. The first name of a topic is its canonical name.
+
+Each rule does a list of actions:
+
+* ``{"say": text}`` logs a message from the character.
+* ``{"narrate": text}`` logs a passage of narrative.
+* ``{"end": true}`` ends the conversation.
+
+Scripts are compiled into tuples of rules and opcodes and an index from
+inputs to rules, and the compiled form is cached in the user's data
+directory, keyed by a hash of the script, so that scripts are only
+parsed when they change.
+'''
+
+import hashlib
+import json
+import marshal
+import os
+from .conversation import Conversation, TopicRule, VerbRule, SimpleMatchingVerb
+from .utils import get_mod_resource, get_user_resource_path
+
+# The opcodes of actions.
+OP_SAY = 0
+OP_NARRATE = 1
+OP_END = 2
+
+_action_opcodes = {'say': OP_SAY, 'narrate': OP_NARRATE, 'end': OP_END}
+
+# The version of the compiled form. Caches of other versions are ignored.
+_COMPILED_VERSION = 1
+
+# The file extension of cached compiled scripts.
+COMPILED_EXTENSION = '.dconv'
+
+def _compile_actions(actions, where):
+    '''Compile a list of actions into a tuple of (opcode, argument) tuples.'''
+    program = []
+    for action in actions:
+        if len(action) != 1 or list(action)[0] not in _action_opcodes:
+            raise ValueError('Unknown action in %s: %r' % (where, action))
+        name, arg = list(action.items())[0]
+        program.append((_action_opcodes[name], arg))
+    return tuple(program)
+
+def compile_script(source, where='conversation script'):
+    '''Parse and compile a conversation script.
+
+    :param bytes source: The JSON source of the script
+    :param str where: Where the script came from, for error messages
+    :returns: The compiled script: a tuple (name, verbs, begin, rules, index)
+              of builtin types only, which :func:`build_conversation` turns
+              into a :class:`dirt.conversation.Conversation`
+    :rtype: tuple
+    '''
+    j = json.loads(source.decode('utf-8'))
+
+    verbs = dict((name, tuple(matches))
+                 for name, matches in j.get('verbs', {}).items())
+
+    begin = tuple((entry.get('when'), _compile_actions(entry['do'], where))
+                  for entry in j.get('begin', []))
+
+    # Rules are ('topic', names, program) or ('verb', verb name, program).
+    # The index maps the same keys as Rule.index_keys to rule positions.
+    rules = []
+    index = {}
+    for position, rule in enumerate(j.get('rules', [])):
+        program = _compile_actions(rule['do'], where)
+        if 'topic' in rule:
+            names = tuple(rule['topic'])
+            rules.append(('topic', names, program))
+            for name in names:
+                index.setdefault(('topic', name), position)
+        elif rule.get('verb') in verbs:
+            rules.append(('verb', rule['verb'], program))
+            for msg in verbs[rule['verb']]:
+                index.setdefault(('msg', msg), position)
+        else:
+            raise ValueError('Rule without a known topic or verb in %s: %r' % (where, rule))
+
+    return j['name'], verbs, begin, tuple(rules), index
+
+class _Script(object):
+    '''A callback which runs a compiled list of actions.'''
+    def __init__(self, program):
+        self.program = program
+
+    def __call__(self, c, ply, *args, **kwargs):
+        for opcode, arg in self.program:
+            if opcode == OP_SAY:
+                c.log_npc_msg(arg)
+            elif opcode == OP_NARRATE:
+                c.log_narrative(arg)
+            elif opcode == OP_END:
+                ply.in_conversation = False
+
+class _BeginScript(_Script):
+    '''A callback which runs a compiled list of actions when a conversation
+    begins under the right circumstances.'''
+    def __init__(self, when, program):
+        _Script.__init__(self, program)
+        self.when = when
+
+    def __call__(self, c, ply, circumstances=None, *args, **kwargs):
+        if self.when is None or self.when == circumstances:
+            _Script.__call__(self, c, ply)
+
+def build_conversation(compiled):
+    '''Make a :class:`dirt.conversation.Conversation` from a compiled script.
+
+    :param tuple compiled: A script compiled by :func:`compile_script`
+    :rtype: dirt.conversation.Conversation
+    '''
+    name, verbs, begin, rules, index = compiled
+
+    c = Conversation(name)
+    for when, program in begin:
+        c.begin_funcs.append(_BeginScript(when, program))
+
+    verb_objects = dict((verb, SimpleMatchingVerb(list(matches)))
+                        for verb, matches in verbs.items())
+    c.add_rules([TopicRule(keys[0], keys[1:], _Script(program))
+                 if kind == 'topic' else
+                 VerbRule(verb_objects[keys], _Script(program))
+                 for kind, keys, program in rules],
+                index)
+    return c
+
+def _cache_path(path):
+    '''Return where the compiled form of the script at mod path PATH is cached.'''
+    name = path.replace('/', '_').replace('\\', '_')
+    return get_user_resource_path(os.path.join('cache', 'conversations',
+                                               name + COMPILED_EXTENSION))
+
+def load_script(path):
+    '''Load the conversation script at PATH in the mods, using the cached
+    compiled form if the script has not changed since it was compiled.
+
+    :param str path: The path to the script, relative to the mod
+    :rtype: dirt.conversation.Conversation
+    '''
+    with get_mod_resource(path) as f:
+        source = f.read()
+    digest = hashlib.sha1(source).digest()
+
+    cache_path = _cache_path(path)
+    try:
+        with open(cache_path, 'rb') as f:
+            version, cached_digest, compiled = marshal.load(f)
+        if version == _COMPILED_VERSION and cached_digest == digest:
+            return build_conversation(compiled)
+    except (OSError, EOFError, ValueError, TypeError):
+        # There is no usable cache.
+        pass
+
+    compiled = compile_script(source, path)
+
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            marshal.dump((_COMPILED_VERSION, digest, compiled), f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # The cache is only an optimization.
+        pass
+
+    return build_conversation(compiled)
@@ -2,7 +2,7 @@
 The dialogmanager module provides a versatile dialog system.
 """
 import pygame
-from dirt.utils import draw_text, load_image
+from dirt.utils import draw_text, render_text, load_image
 
 class Say(object):
     def __init__(self, text):
@@ -152,7 +152,7 @@ class DialogManager(object):
             if draw_choices:
                 cursor = 165
                 for i, choice in enumerate(self.choices):
-                    block = font.render(choice, True, (0, 0, 0))
+                    block = render_text(font, choice, (0, 0, 0))
 
                     window.blit(block, (10, cursor))
 
@@ -165,5 +165,8 @@ class DialogManager(object):
             draw_text(font, self.text, (0, 0, 0), window, 20, 20)
             draw_text(font, '[Enter]', (0, 0, 0), window, 250, 210)
 
+    def is_animating(self):
+        return self.mode == 'saying'
+
     def is_active(self):
         return self.mode != 'inactive'
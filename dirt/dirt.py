@@ -1,13 +1,21 @@
 #!/usr/bin/env python3
 # dirt.py - a low fantasy adventure game set in Maya
-import sys, pygame, math, random, os, itertools
-from collections import namedtuple
+import sys, pygame, math, os, itertools, time, random
 from pygame.locals import *
 from .dialogmanager import DialogManager, Say, Choose, BigMessage
+from .dirtyrects import DirtyRects
+from .preloader import Preloader
+from .profiler import FrameProfiler, IDLE
+from .replay import ReplayRecorder, ReplayPlayer, state_checksum
 from .world import World
-from .monsters import Rat, Jyesula, Proselytizer, Guard
-import dirt.convlib as convlib
-from dirt.utils import draw_text, game_time_to_string, get_resource_stream, register_mod, load_image, load_sound
+from .game import GameState, Player, load_mods, dir_as_offset, NORTH, SOUTH, WEST, NUM_DIRS, \
+                  ACTION_UP, ACTION_DOWN, ACTION_LEFT, ACTION_RIGHT, ACTION_CONFIRM
+from dirt.utils import draw_text, render_text, game_time_to_string, get_mod_resource, rescan_mods, load_image, load_sound, asset_cache, text_cache
+
+# When this module was imported, and when each phase of starting up the
+# game finished, as (name, time) tuples.  See print_startup_report.
+startup_time = time.perf_counter()
+startup_marks = []
 
 # Developer privileges / Allow backtick (`) console.
 allow_edit = False
@@ -34,138 +42,74 @@ def dev_console_print(s):
 allowed_console_chars = \
   'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789./ '
 
-# Modes that the program can be in.
-MODE_GAME        = 0
-MODE_DEV_CONSOLE = 1
-current_mode = MODE_GAME
+# Only push the parts of the screen that changed to the display.
+use_dirty_rects = True
 
-# Cardinal directions
-NORTH    = 0
-EAST     = 1
-SOUTH    = 2
-WEST     = 3
-NUM_DIRS = 4
-
-# Define the different kinds of tile.
-# Fields:
-#   substrate - what tile's image should be drawn under this (or None)
-#   is_beneath - whether the tile should be draw under other tiles
-#   is_solid - whether the player can walk through this tile
-#   img - the path to the tile's image
-TileKind = namedtuple('TileKind', 'substrate is_beneath is_solid img')
-tile_kinds = {}
+# When nothing is animating, sleep until an event arrives, waking up
+# at least every idle_timeout milliseconds.
+idle_timeout = 1000
+IDLE_WAKEUP_EVENT = USEREVENT
 
-class Game(object):
-    """A Game stores information which needs to be everywhere."""
-    def __init__(self):
-        """Create a new Game object."""
-        # The current minute of the in-game day.
-        self.time = 60 * 5
+# The replay being recorded and the replay being played, if any.
+# While a replay is played, the game runs as fast as it can and only
+# draws if replay_draw is set.
+recorder = None
+replay = None
+replay_draw = False
 
-font = None
-player = None
+# What each key does in the game, unless a dialog or conversation is open.
+KEY_ACTIONS = {
+    K_UP: ACTION_UP,
+    K_DOWN: ACTION_DOWN,
+    K_LEFT: ACTION_LEFT,
+    K_RIGHT: ACTION_RIGHT,
+    K_RETURN: ACTION_CONFIRM
+}
 
-class Player:
-    def __init__(self, x, y):
-        self.health = 3
-        self.max_health = 3
-        self.money = 3
-        self.facing = SOUTH
-        self.opponent = None
-        self.in_menu = False
-        self.conversation = None
-        self.in_conversation = False
-        self.time_passed = False
-        self.x = x
-        self.y = y
-
-    def stop_time(self):
-        """
-        Make time considered to be "not passed".
-
-        This must happen after time passes (when the user walks,
-        attacks, etc.) so that time does not endlessly keep passing.
-        """
-        self.time_passed = False
-
-    def pass_time(self):
-        """
-        Make time considered to be "passed".
-
-        This has many effects:
-
-        * The game clock advances by one minute.
-        * Enemies re-engage the player if they are in battle.
-        * A random encounter might happen.
-        """
-        self.time_passed = True
-
-    def time_has_passed(self):
-        'Return whether time is considered to be "passed".'
-        return self.time_passed
-
-    def take_damage(self, amount):
-        "Make the player take an AMOUNT of damage."
-        self.health = max(0, self.health - amount)
-
-    def gain_money(self, amount):
-        "Make the player gain an AMOUNT of money."
-        self.money += amount
-
-    def lose_money(self, amount):
-        "Make the player lose an AMOUNT of money."
-        self.money = max(0, self.money - amount)
-
-    def is_dead(self):
-        "Return whether the player is dead."
-        return self.health <= 0
-
-    def leave_battle(self):
-        "Make the player leave the current battle."
-        self.opponent = None
-
-    def leave_menu(self):
-        "Make the player leave the current menu."
-        self.in_menu = False
-
-    def is_in_battle(self):
-        "Return whether the player is in a battle."
-        return self.opponent is not None
-
-    def is_in_menu(self):
-        "Return whether the player is in a menu."
-        return self.in_menu
-
-    def is_in_conversation(self):
-        "Return whether the player is in a new-style conversation."
-        return self.in_conversation
-    
-    def enter_battle(self, opponent):
-        "Make the player enter battle."
-        self.opponent = opponent
+# Times each frame of the game; see the PROFILE console command.
+profiler = FrameProfiler()
 
-    def enter_menu(self):
-        "Make the player enter the menu."
-        self.in_menu = True
+# Where the profiler overlay is drawn.
+PROFILER_RECT = (160, 0, 160, 240)
 
-    def attack(self, enemy):
-        "Make the player attack an enemy."
-        enemy.take_damage(1)
+# Modes that the program can be in.
+MODE_GAME        = 0
+MODE_DEV_CONSOLE = 1
+current_mode = MODE_GAME
 
-    def get_opponent(self):
-        "Return the player's opponent."
-        return self.opponent
+# Assets which are read and decoded in the background when the game starts.
+PRELOAD_IMAGES = [
+    'data/characters/jauld/face.png',
+    'data/proselytizer.png',
+    'data/rat.png',
+    'data/guard.png',
+    'data/jyesula.png',
+    'data/speech_bubble.png',
+    'data/heart_full.png',
+    'data/heart_half.png',
+    'data/heart_empty.png',
+    'data/money_one.png',
+    'data/money_two.png',
+    'data/money_three.png',
+    'data/money_four.png',
+    'data/money_five.png',
+    'data/money_ten.png',
+    'data/money_sixteen.png',
+    'data/money_thirtytwo.png',
+    'data/ui_frame.png',
+    'data/night_throne.png',
+    'data/day_throne.png',
+    'data/ghost.png'
+]
+PRELOAD_SOUNDS = [
+    'data/blow.wav'
+]
 
+# The TileKind of each tile number, as defined by the mods.
+tile_kinds = {}
 
-def dir_as_offset(direction):
-    if direction == NORTH:
-        return 0, -1
-    elif direction == EAST:
-        return 1, 0
-    elif direction == SOUTH:
-        return 0, 1
-    elif direction == WEST:
-        return -1, 0
+font = None
+player = None
 
 def dialog_action_throne_room():
     global player
@@ -177,8 +121,10 @@ def dialog_action_throne_room():
             yield Say('You have\nalways been\nfine without\nmoney')
             yield Say('Why do you\nneed it\nnow?')
         elif result == 2:
+            # Conversations are only imported once they are needed.
+            import dirt.convlib as convlib
             player.in_conversation = True
-            player.conversation = convlib.jyesula
+            player.conversation = convlib.get_conversation('jyesula')
             player.conversation.run_begin_funcs(player, circumstances='throneroom')
         else:
             break
@@ -234,28 +180,61 @@ def draw_single_tile(win, forward, right, tile_kinds, tile_images, tile_kind_id,
             draw_single_tile(win, forward, right, tile_kinds, tile_images, tile.substrate, True)
     elif beneathness == tile.is_beneath:
         # Just focus on drawing the tile itself.
+        surf, pos = tile_images[tile.img][forward, right]
+        win.blit(surf, pos)
+
+def slice_tile_image(image):
+    """
+    Cut a tile image into the pieces that are seen in each cell of the
+    view cone.
+
+    Returns a dict which maps (forward, right) to a tuple (surf, pos),
+    where surf is a subsurface of IMAGE and pos is where to draw it.
+    """
+    slices = {}
+    for forward in range(0, 4):
         clip_y = 480 - 160 * forward
-        clip_x = 0
-        flip = False
-
-        if right == 0:
-            clip_w = 160
-        else:
-            clip_w = 80
-        
-        if right <= 0:
-            screen_x_offset = 0
-            clip_x = 480 + 160 * right
-        else:
-            screen_x_offset = 80
-            clip_x = 480 - 160 * right + 80
-            flip = True
 
-        win.blit(tile_images[tile.img].regular,
-                 (screen_x_offset, 0),
-                 (clip_x, clip_y, clip_w, 160))
-
-def draw_world_with_beneathness(win, x, y, facing, world, tile_kinds, tile_images, beneathness):
+        for right in range(-3, 4):
+            if right == 0:
+                clip_w = 160
+            else:
+                clip_w = 80
+
+            if right <= 0:
+                screen_x_offset = 0
+                clip_x = 480 + 160 * right
+            else:
+                screen_x_offset = 80
+                clip_x = 480 - 160 * right + 80
+
+            slices[forward, right] = \
+              (image.subsurface((clip_x, clip_y, clip_w, 160)),
+               (screen_x_offset, 0))
+    return slices
+
+def load_tile_images(tile_kinds):
+    """
+    Load the images for all TILE_KINDS, converted to the display's pixel
+    format and sliced with :func:`slice_tile_image`.
+
+    Returns a dict which maps each image path to its slices.
+    """
+    tile_images = {}
+    for kind in tile_kinds.values():
+        if kind.img is not None and kind.img not in tile_images:
+            image = load_image(kind.img).convert_alpha()
+            tile_images[kind.img] = slice_tile_image(image)
+    return tile_images
+
+def build_view_cone(facing):
+    """
+    Return the cells that are visible when looking in direction FACING.
+
+    Each entry is a tuple (forward, right, dx, dy), where (dx, dy) is
+    the offset of the cell from the viewer.  Entries are ordered from
+    back to front so that nearer tiles are drawn over farther ones.
+    """
     angle = 0
     if facing == NORTH:
         angle = math.pi/2
@@ -263,38 +242,205 @@ def draw_world_with_beneathness(win, x, y, facing, world, tile_kinds, tile_image
         angle = math.pi
     elif facing == SOUTH:
         angle = 3*math.pi/2
-    
+
     sa = math.sin(angle)
     ca = math.cos(angle)
+    cone = []
     for forward in range(3, -1, -1):
         for right in itertools.chain(range(-3, 0), range(3, -1, -1)):
-            pos_x = x + int(round(forward*ca + right*sa))
-            pos_y = y + int(round(-forward*sa + right*ca))
-            
-            if pos_x >= 0 and pos_x < world.width and \
-               pos_y >= 0 and pos_y < world.height:
-                tile = world.at(pos_x, pos_y)
-                draw_single_tile(win, forward, right, tile_kinds, tile_images, tile, beneathness)
+            dx = int(round(forward*ca + right*sa))
+            dy = int(round(-forward*sa + right*ca))
+            cone.append((forward, right, dx, dy))
+    return tuple(cone)
+
+# The view cone for each direction, indexed by the direction.
+VIEW_CONES = tuple(build_view_cone(d) for d in range(NUM_DIRS))
+
+# Just the (dx, dy) offsets of each view cone, for World.cells.
+VIEW_CONE_OFFSETS = tuple(tuple((dx, dy) for _, _, dx, dy in cone)
+                          for cone in VIEW_CONES)
 
 def draw_world(window, x, y, facing, world, tile_kinds, tile_images):
-    draw_world_with_beneathness(window, x, y, facing, world, tile_kinds, tile_images, True)
-    draw_world_with_beneathness(window, x, y, facing, world, tile_kinds, tile_images, False)
+    # Draw the beneath layer as we walk the cone and remember which
+    # cells still need their upper layer drawn on top of it.
+    upper = []
+    tiles = world.cells(x, y, VIEW_CONE_OFFSETS[facing])
+    for (forward, right, _, _), tile in zip(VIEW_CONES[facing], tiles):
+        if tile is not None:
+            draw_single_tile(window, forward, right, tile_kinds, tile_images, tile, True)
+            if not tile_kinds[tile].is_beneath:
+                upper.append((forward, right, tile))
+
+    for forward, right, tile in upper:
+        draw_single_tile(window, forward, right, tile_kinds, tile_images, tile, False)
+
+class ViewCache(object):
+    """
+    A ViewCache holds a rendered copy of the 3D viewport (the sky and
+    the world) so that it only has to be redrawn when the view changes.
+    """
+    def __init__(self, window, size=(160, 160)):
+        """Create a new ViewCache whose surface matches WINDOW's format."""
+        self.surface = pygame.Surface(size, 0, window)
+        self.key = None
+
+    def draw(self, window, x, y, facing, sky, world, tile_kinds, tile_images):
+        "Draw the view from (X, Y) looking toward FACING onto WINDOW."
+        key = (x, y, facing, sky, world.revision)
+
+        if key != self.key:
+            self.surface.fill((255, 255, 255))
+
+            if sky is not None:
+                self.surface.blit(sky, (0, 0))
+
+            draw_world(self.surface, x, y, facing,
+                       world, tile_kinds, tile_images)
+            self.key = key
+
+        window.blit(self.surface, (0, 0))
+
+def wait_for_events(timeout):
+    """
+    Block until an event arrives or TIMEOUT milliseconds pass,
+    then return all the pending events.
+    """
+    pygame.time.set_timer(IDLE_WAKEUP_EVENT, timeout)
+    events = [pygame.event.wait()] + pygame.event.get()
+    pygame.time.set_timer(IDLE_WAKEUP_EVENT, 0)
+
+    return [e for e in events if e.type != IDLE_WAKEUP_EVENT]
+
+def get_frame_events(frame, wait):
+    """
+    Return the input events of frame number FRAME.
+
+    The events come from the replay being played, if any; otherwise
+    they come from pygame, sleeping until something happens if WAIT is
+    set.  If a replay is being recorded, the events are recorded.
+    """
+    if replay is not None:
+        pygame.event.pump()
+        events = replay.events(frame)
+    elif wait:
+        with profiler.span(IDLE):
+            events = wait_for_events(idle_timeout)
+    else:
+        events = pygame.event.get()
 
-def load_skybox(prefix):
+    if recorder is not None:
+        recorder.record(frame, events)
+
+    return events
+
+def play_world_music(world):
+    "Start playing the background music of WORLD."
+    pygame.mixer.music.load(get_mod_resource(os.path.join('data', world.bgm_path)))
+    pygame.mixer.music.play(loops=-1)
+
+def skybox_paths(prefix):
     path_prefix = 'data/' + prefix
     return [
-        load_image(path_prefix + '_north.png'),
-        load_image(path_prefix + '_east.png'),
-        load_image(path_prefix + '_south.png'),
-        load_image(path_prefix + '_west.png')
+        path_prefix + '_north.png',
+        path_prefix + '_east.png',
+        path_prefix + '_south.png',
+        path_prefix + '_west.png'
     ]
 
+def load_skybox(prefix):
+    return [load_image(path) for path in skybox_paths(prefix)]
+
+def preload_world(preloader, world):
+    "Start loading the skyboxes of WORLD in the background."
+    for prefix in (world.day_sky_prefix, world.night_sky_prefix):
+        for path in skybox_paths(prefix):
+            preloader.preload_image(path)
+
+def wait_for_preloader(window, font, preloader):
+    "Show a loading screen until PRELOADER has loaded everything."
+    clock = pygame.time.Clock()
+
+    while True:
+        preloader.poll()
+        done, total = preloader.get_progress()
+
+        window.fill((0, 0, 0))
+        draw_text(font, 'Loading...', (255, 255, 255), window, 10, 100)
+        window.fill((255, 255, 255), (10, 120, 300 * done // max(total, 1), 8))
+        pygame.display.flip()
+
+        if preloader.is_done():
+            break
+
+        pygame.event.pump()
+        clock.tick(40)
+
+def mark_startup(name):
+    "Record that the phase NAME of starting up the game just finished."
+    startup_marks.append((name, time.perf_counter()))
+
+def print_startup_report():
+    "Print how long each phase of starting up the game took."
+    print('Startup profile:')
+    last = startup_time
+    for name, when in startup_marks:
+        print('  %-20s %8.1f ms' % (name, (when - last) * 1000))
+        last = when
+    print('  %-20s %8.1f ms' % ('total', (last - startup_time) * 1000))
+
+def get_option(name):
+    "Return the value given to the command line option NAME, or None."
+    args = sys.argv[1:]
+    if name in args and args.index(name) + 1 < len(args):
+        return args[args.index(name) + 1]
+    return None
+
+def print_replay_report(frame_times):
+    "Print how long the frames of a replay took."
+    frame_times = sorted(frame_times)
+    if not frame_times:
+        return
+
+    print('Replay profile (%d frames):' % len(frame_times))
+    print('  %-20s %8.3f ms' % ('mean', sum(frame_times) / len(frame_times) * 1000))
+    for name, fraction in (('median', 0.5), ('95th percentile', 0.95), ('99th percentile', 0.99)):
+        print('  %-20s %8.3f ms' % (name, frame_times[int(fraction * (len(frame_times) - 1))] * 1000))
+    print('  %-20s %8.3f ms' % ('max', frame_times[-1] * 1000))
+    print('  %-20s %8.1f ms' % ('total', sum(frame_times) * 1000))
+
 def main():
-    global current_mode, allow_edit, player, dev_console_input, edit_mode_chosen_tile, tile_kinds
+    global current_mode, allow_edit, player, dev_console_input, edit_mode_chosen_tile, tile_kinds, recorder, replay, replay_draw
+
+    profile_startup = '--profile-startup' in sys.argv[1:]
+
+    # Seed the random number generator, so that games can be replayed.
+    # Replays are played without a window or sound unless asked for.
+    seed = get_option('--seed')
+    if get_option('--replay') is not None:
+        replay = ReplayPlayer(get_option('--replay'))
+        replay_draw = '--replay-draw' in sys.argv[1:]
+        seed = replay.seed
+        if not replay_draw:
+            os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    elif seed is not None:
+        seed = int(seed)
+    else:
+        seed = random.getrandbits(63)
+    random.seed(seed)
+
+    if get_option('--record') is not None:
+        recorder = ReplayRecorder(get_option('--record'), seed)
 
-    # Initialize Pygame.
-    pygame.init()
+    # Initialize only the parts of Pygame that the game uses.
+    pygame.display.init()
     pygame.font.init()
+    try:
+        pygame.mixer.init()
+    except pygame.error:
+        # Play on without sound, like pygame.init() would.
+        pass
+    mark_startup('init pygame')
 
     # Load the font.
     font = pygame.font.Font(None, 20)
@@ -303,23 +449,30 @@ def main():
     # For fullscreen:
     #window = pygame.display.set_mode((320, 240), FULLSCREEN)
     window = pygame.display.set_mode((320, 240))
+    mark_startup('open window')
     
     # Load mods.
-    with get_resource_stream('modlist.txt') as f:
-        for line in f:
-            line = line.decode('utf-8')
-            mod_name = line.strip()
-            if mod_name:
-                cfg = register_mod(mod_name)
-                if 'tiles' in cfg:
-                    for tile_id, tile in cfg['tiles'].items():
-                        if 'substrate' not in tile:
-                            tile['substrate'] = None
-                        
-                        tile_kinds[int(tile_id)] = TileKind(substrate=tile['substrate'],
-                                                            is_beneath=tile['is_beneath'],
-                                                            is_solid=tile['is_solid'],
-                                                            img=tile['img'])
+    tile_kinds.update(load_mods())
+
+    mark_startup('load mods')
+
+    # Load the world.
+    world = World()
+    world.load('data/castle.json')
+    play_world_music(world)
+
+    # Read and decode the assets in the background.
+    preloader = Preloader()
+    for path in PRELOAD_IMAGES:
+        preloader.preload_image(path)
+    for kind in tile_kinds.values():
+        if kind.img is not None:
+            preloader.preload_image(kind.img)
+    for path in PRELOAD_SOUNDS:
+        preloader.preload_sound(path)
+    preload_world(preloader, world)
+    wait_for_preloader(window, font, preloader)
+    mark_startup('preload assets')
 
     # Load sprites.
     jauld_img = load_image('data/characters/jauld/face.png')
@@ -342,22 +495,12 @@ def main():
     spike_sound = load_sound('data/blow.wav')
 
     # Load images for all tiles.
-    TileImage = namedtuple('TileImage', 'regular flipped')
-    tile_images = {}
-    for kind in tile_kinds.values():
-        if kind.img is not None:
-            regular = load_image(kind.img)
-            flipped = pygame.transform.flip(regular, True, False)
-            tile_images[kind.img] = \
-              TileImage(regular=regular,
-                        flipped=flipped)
+    tile_images = load_tile_images(tile_kinds)
+    mark_startup('load sprites')
 
     # Set up the player.
     player = Player(12, 16)
 
-    # Set up the menu.
-    selection = 0
-
     # Set up overall game variables.
     denominations = {
         1: money_one,
@@ -369,10 +512,7 @@ def main():
         16: money_sixteen,
         32: money_thirtytwo
     }
-    day_length = 60 * 24
-    game = Game()
-    world = World()
-    world.load('data/castle.json')
+    state = GameState(world, tile_kinds, player)
     
     conversation_input = ''
 
@@ -381,52 +521,44 @@ def main():
     day_sky = load_skybox(world.day_sky_prefix)
 
     skybox = night_sky # We'll use the night sky first
+
+    # The sky and the world are only redrawn when the view changes.
+    view_cache = ViewCache(window)
     
     # new DialogManager system
     dialog_manager = DialogManager()
     dialog_manager.start(dialog_action_read_lettre)
 
+    # Only the parts of the screen that changed get pushed to the display.
+    dirty_rects = DirtyRects(window.get_rect())
+    drawn_mode = None
+
     clock = pygame.time.Clock()
     frame_counter = 0
+    frame_times = []
 
     # Loop until the user quits.
     done = False
     while not done:
         frame_counter += 1
+        frame_start = time.perf_counter()
+        profiler.begin_frame()
         
         if current_mode == MODE_GAME:
             # Update the state of the dialog.
+            profiler.begin('dialog')
             dialog_manager.update()
+            profiler.end('dialog')
 
-            # Clear the screen.
-            window.fill((255, 255, 255))
-
-            # Draw the sky.
-            if skybox[player.facing] is not None:
-                window.blit(skybox[player.facing], (0, 0))# (0, 0, 160, 89))
-
-            # Draw the world.
-            draw_world(window,
-                       player.x, player.y, player.facing,
-                       world,
-                       tile_kinds, tile_images)
-                       
-            # If we in edit mode, then make flashing tile ahead
-            if allow_edit and frame_counter % 7 < 3:
-                draw_single_tile(window, 1, 0, tile_kinds, tile_images, edit_mode_chosen_tile, True)
-                draw_single_tile(window, 1, 0, tile_kinds, tile_images, edit_mode_chosen_tile, False)
-
-            # Draw the enemy if we are in battle.
+            # Work out what each part of the screen will show.
+            profiler.begin('layout')
+            edit_blink = allow_edit and frame_counter % 7 < 3
+            opponent_state = None
             if player.is_in_battle():
-                player.get_opponent().draw(window)
-
-            # Draw the border around the world.
-            window.blit(ui_frame_img, (0, 0))
-
-            # Draw the player's avatar.
-            window.blit(jauld_img, (165, 0))
+                mouth = player.get_opponent().mouth
+                opponent_state = (player.get_opponent(),
+                                  mouth.is_talking() and mouth.message_text)
 
-            # Draw the player's money.
             coins = []
             left = player.money
 
@@ -435,76 +567,183 @@ def main():
                     coins += [denom]
                     left -= denom
 
-            cursor = 300
-            for coin in coins:
-                window.blit(denominations[coin], (cursor, 10))
-                cursor -= 6
-
-            # Draw the player's health.
-            for i in range(0, player.max_health):
-                if player.health - i <= 0:
-                    # Draw an empty heart.
-                    window.blit(heart_empty_img, (200 + (i * 20), 15))
-                elif player.health - i == 0.5:
-                    # Draw a half heart.
-                    window.blit(heart_half_img, (200 + (i * 20), 15))
-                else:
-                    # Draw a full heart.
-                    window.blit(heart_full_img, (200 + (i * 20), 15))
-
-            # Draw the time of day.
-            msg = font.render("Game time: " +
-                              game_time_to_string(game.time),
-                              True, (0, 0, 0))
-            window.blit(msg, (170, 180))
-            
-            # Draw the dialog if it is active.
-            if dialog_manager.is_active():
-                dialog_manager.draw(window, font, draw_choices=(not player.in_conversation))
-            
-            if (player.conversation is not None and not player.is_in_menu() and not dialog_manager.is_active()) or player.in_conversation:
-                log = player.conversation.log
-                lines = []
-                for entry in log:
-                    lines += str(entry).split('\n')
-                if player.in_conversation:
-                    # Draw black background for conversation
-                    window.fill((0, 0, 0), (0, 240 - 5 * font.get_linesize(), 320, 5 * font.get_linesize()))
-                    for i in range(0, min(len(lines), 4)):
-                        color = (255, 255, 255)
-                        line = lines[-i - 1]
-                        if line.startswith('Jyesula:'):
-                            color = (255, 0, 0)
-                        draw_text(font, line, color, window, 0, 240 - (2+i) * font.get_linesize())
-                    draw_text(font, 'Talk>' + conversation_input + '|', (255, 255, 255), window, 0, 240 - font.get_linesize())
-                else:
-                    for i in range(0, min(len(lines), 4)):
-                        draw_text(font, lines[-1 - i], (128, 128, 128), window, 0, 240 - (1+i) * font.get_linesize())
+            time_text = "Game time: " + game_time_to_string(state.time)
+
+            show_log = (player.conversation is not None and not player.is_in_menu() and not dialog_manager.is_active()) or player.in_conversation
+            show_menu = not show_log and not player.in_conversation and player.is_in_menu()
+
+            lines = ()
+            if show_log:
+                lines = player.conversation.display_lines
+
+            menu_options = []
+            if show_menu:
+                menu_options = player.get_opponent().get_options(player)
+
+            # Find out which parts of the screen changed.
+            if current_mode != drawn_mode:
+                dirty_rects.invalidate()
+                drawn_mode = current_mode
+
+            dirty_rects.mark('view', (0, 0, 160, 160),
+                             (player.x, player.y, player.facing,
+                              skybox[player.facing], world.revision,
+                              edit_mode_chosen_tile if edit_blink else None,
+                              opponent_state))
+            draw_choices = not player.in_conversation
+            if dialog_manager.mode == 'bigmessage':
+                dialog_rect = window.get_rect()
+            else:
+                dialog_rect = (0, 0, 160, 240)
+            dirty_rects.mark('dialog', dialog_rect,
+                             (dialog_manager.mode, dialog_manager.text,
+                              dialog_manager.backdrop,
+                              tuple(dialog_manager.choices),
+                              dialog_manager.selection, draw_choices))
+            dirty_rects.mark('money',
+                             (300 - 6 * len(coins), 10, 20 + 6 * len(coins), 20),
+                             tuple(coins))
+            dirty_rects.mark('hearts', (200, 15, 20 * player.max_health, 20),
+                             (player.health, player.max_health))
+            dirty_rects.mark('clock', ((170, 180), font.size(time_text)),
+                             time_text)
+            dirty_rects.mark('log',
+                             (0, 240 - 5 * font.get_linesize(),
+                              320, 5 * font.get_linesize()),
+                             (show_log, player.in_conversation,
+                              tuple(lines), conversation_input))
+            dirty_rects.mark('menu', (0, 165, 160, 75),
+                             (tuple(menu_options), state.selection))
+            if profiler.overlay_enabled:
+                dirty_rects.mark('profiler', PROFILER_RECT,
+                                 tuple(profiler.overlay_lines()))
+
+            rects = dirty_rects.pop_rects()
+            profiler.end('layout')
+            if (replay is None or replay_draw) and (not use_dirty_rects or rects):
+                # Clear the screen.
+                profiler.begin('world')
+                window.fill((255, 255, 255))
+
+                # Draw the sky and the world.
+                view_cache.draw(window,
+                                player.x, player.y, player.facing,
+                                skybox[player.facing],
+                                world,
+                                tile_kinds, tile_images)
+
+                # If we in edit mode, then make flashing tile ahead
+                if edit_blink:
+                    draw_single_tile(window, 1, 0, tile_kinds, tile_images, edit_mode_chosen_tile, True)
+                    draw_single_tile(window, 1, 0, tile_kinds, tile_images, edit_mode_chosen_tile, False)
+
+                # Draw the enemy if we are in battle.
+                if player.is_in_battle():
+                    player.get_opponent().draw(window)
+
+                profiler.end('world')
+
+                # Draw the border around the world.
+                profiler.begin('hud')
+                window.blit(ui_frame_img, (0, 0))
+
+                # Draw the player's avatar.
+                window.blit(jauld_img, (165, 0))
+
+                # Draw the player's money.
+                cursor = 300
+                for coin in coins:
+                    window.blit(denominations[coin], (cursor, 10))
+                    cursor -= 6
+
+                # Draw the player's health.
+                for i in range(0, player.max_health):
+                    if player.health - i <= 0:
+                        # Draw an empty heart.
+                        window.blit(heart_empty_img, (200 + (i * 20), 15))
+                    elif player.health - i == 0.5:
+                        # Draw a half heart.
+                        window.blit(heart_half_img, (200 + (i * 20), 15))
+                    else:
+                        # Draw a full heart.
+                        window.blit(heart_full_img, (200 + (i * 20), 15))
+
+                profiler.end('hud')
+
+                # Draw the time of day.
+                profiler.begin('text')
+                msg = render_text(font, time_text, (0, 0, 0))
+                window.blit(msg, (170, 180))
+
+                # Draw the dialog if it is active.
+                if dialog_manager.is_active():
+                    dialog_manager.draw(window, font, draw_choices=draw_choices)
+
+                if show_log:
+                    if player.in_conversation:
+                        # Draw black background for conversation
+                        window.fill((0, 0, 0), (0, 240 - 5 * font.get_linesize(), 320, 5 * font.get_linesize()))
+                        for i in range(0, min(len(lines), 4)):
+                            line, color = lines[-i - 1]
+                            draw_text(font, line, color, window, 0, 240 - (2+i) * font.get_linesize())
+                        draw_text(font, 'Talk>' + conversation_input + '|', (255, 255, 255), window, 0, 240 - font.get_linesize())
+                    else:
+                        for i in range(0, min(len(lines), 4)):
+                            draw_text(font, lines[-1 - i][0], (128, 128, 128), window, 0, 240 - (1+i) * font.get_linesize())
+
+                # Draw the menu if the menu is active.
+                elif show_menu:
+                    cursor = 165
+                    i = 0
+
+                    for choice in menu_options:
+                        text_surf = render_text(font, choice, (0, 0, 0))
+                        window.blit(text_surf, (10, cursor))
+
+                        if state.selection == i:
+                            # Draw a box next to the selected option.
+                            window.fill((0, 0, 0), (3, cursor + 5, 4, 4))
+
+                        cursor += 18
+                        i += 1
 
-            # Draw the menu if the menu is active.
-            elif not player.in_conversation and player.is_in_menu():
-                cursor = 165
-                i = 0
+                profiler.end('text')
 
-                for choice in player.get_opponent().get_options(player):
-                    text_surf = font.render(choice, True, (0, 0, 0))
-                    window.blit(text_surf, (10, cursor))
+                # Draw the profiler on top of everything.
+                if profiler.overlay_enabled:
+                    profiler.draw(window, PROFILER_RECT)
 
-                    if selection == i:
-                        # Draw a box next to the selected option.
-                        window.fill((0, 0, 0), (3, cursor + 5, 4, 4))
+                # Update the window.
+                profiler.begin('present')
+                if use_dirty_rects:
+                    pygame.display.update(rects)
+                else:
+                    pygame.display.flip()
+                profiler.end('present')
 
-                    cursor += 18
-                    i += 1
-            
-            # Update the window.
-            pygame.display.flip()
+                if profile_startup:
+                    mark_startup('first frame')
+                    print_startup_report()
+                    profile_startup = False
 
             # React to user input.
-            for event in pygame.event.get():
+            # Sleep until something happens unless something is animating,
+            # or a battle is over and should end on the next update.
+            opponent = player.get_opponent() if player.is_in_battle() else None
+            animating = (allow_edit
+                         or dialog_manager.is_animating()
+                         or (opponent is not None
+                             and (opponent.mouth.is_talking()
+                                  or opponent.is_dead())))
+            events = get_frame_events(frame_counter, not animating)
+            profiler.begin('events')
+            for event in events:
                 if event.type == QUIT:
                     # Quit the game.
                     done = True
+                elif event.type == VIDEOEXPOSE:
+                    # The window needs to be redrawn completely.
+                    dirty_rects.invalidate()
                 elif event.type == KEYDOWN:
                     if event.key == K_ESCAPE:
                         # Quit the game.
@@ -527,147 +766,63 @@ def main():
                             conversation_input += ch
                     elif dialog_manager.is_active():
                             dialog_manager.key_pressed(event.key)
-                    elif player.is_in_menu() and player.is_in_battle():
-                        # Handle battle menu navigation and choosing.
-                        enemy = player.get_opponent()
-
-                        if selection >= len(enemy.get_options(player)):
-                            selection = len(enemy.get_options(player)) - 1
-
-                        if event.key == K_UP:
-                            if selection > 0:
-                                selection -= 1
-                        elif event.key == K_DOWN:
-                            if selection < len(enemy.get_options(player)) - 1:
-                                selection += 1
-                        elif event.key == K_RETURN:
-                            # Select the current menu item.
-                            enemy.suffer(player,
-                                         enemy.get_options(player)[selection])
-                    else:
-                        # Handle player movement.
-                        if event.key == K_RETURN and player.is_in_battle():
-                            player.enter_menu()
-                        elif event.key == K_RIGHT:
-                            # Turn the player right.
-                            player.facing = (player.facing + 1) % NUM_DIRS
-                        elif event.key == K_LEFT:
-                            # Turn the player left.
-                            player.facing = (player.facing - 1) % NUM_DIRS
-                        elif event.key == K_UP:
-                            # Attempt to move the player forward.
-                            offset = dir_as_offset(player.facing)
-                            if player.x + offset[0] >= 0 and \
-                               player.x + offset[0] < world.width and \
-                               player.y + offset[1] >= 0 and \
-                               player.y + offset[1] < world.height:
-                                if allow_edit or not tile_kinds[world.at(player.x + offset[0],
-                                                          player.y + offset[1])].is_solid:
-                                    player.x += offset[0]
-                                    player.y += offset[1]
-                                    if not allow_edit:
-                                        player.pass_time()
-
-                                    if player.is_in_battle():
-                                        player.get_opponent().follow(player)
-                                else:
-                                    target = (player.x + offset[0],
-                                              player.y + offset[1])
-                                    if target == (14, 18):
-                                        dialog_manager.start(dialog_action_tavern)
-                                    elif target == (12, 29):
-                                        # Enter the throne room of Jyesula.
-                                        if game.time < 60 * 6 or game.time >= 60 * 19:
-                                            backdrop = night_throne_img
-                                        else:
-                                            backdrop = day_throne_img
-
-                                        dialog_manager.start(dialog_action_throne_room, backdrop)
-                                    elif target == (10, 16):
-                                        # Enter the ghost room.
-                                        dialog_manager.start(dialog_action_ghost, ghost_img)
-                                    elif target == (12, 15):
-                                        dialog_manager.start(dialog_action_guard_blocks_you)
-                                    elif world.at(*target) == 2:
-                                        dialog_manager.start(dialog_action_its_locked)
-                        elif event.key == K_DOWN:
-                            # Attempt to move the player backward.
-                            offset = dir_as_offset(player.facing)
-                            if allow_edit or not tile_kinds[world.at(player.x - offset[0],
-                                                       player.y - offset[1])].is_solid:
-                                player.x -= offset[0]
-                                player.y -= offset[1]
-                                if not allow_edit:
-                                    player.pass_time()
-
-                                if player.is_in_battle():
-                                    player.get_opponent().follow(player)
-                        
+                    elif event.key in KEY_ACTIONS:
+                        state.allow_edit = allow_edit
+                        target = state.apply(KEY_ACTIONS[event.key])
+
+                        # React to walking into things.
+                        if target == (14, 18):
+                            dialog_manager.start(dialog_action_tavern)
+                        elif target == (12, 29):
+                            # Enter the throne room of Jyesula.
+                            if state.is_night():
+                                backdrop = night_throne_img
+                            else:
+                                backdrop = day_throne_img
+
+                            dialog_manager.start(dialog_action_throne_room, backdrop)
+                        elif target == (10, 16):
+                            # Enter the ghost room.
+                            dialog_manager.start(dialog_action_ghost, ghost_img)
+                        elif target == (12, 15):
+                            dialog_manager.start(dialog_action_guard_blocks_you)
+                        elif target is not None and world.at(*target) == 2:
+                            dialog_manager.start(dialog_action_its_locked)
+                    elif allow_edit and not (player.is_in_menu() and player.is_in_battle()):
                         # Check map editing stuff
-                        if allow_edit:
-                            if event.key == K_p:
-                                # Edit tile ahead
-                                ox, oy = dir_as_offset(player.facing)
-                                tx, ty = player.x + ox, player.y + oy
-                                world.set_at(tx, ty, edit_mode_chosen_tile)
-                            elif event.key == K_h:
-                                edit_mode_chosen_tile = edit_mode_chosen_tile - 1
-                                if edit_mode_chosen_tile < 0:
-                                    edit_mode_chosen_tile += len(tile_kinds)
-                            elif event.key == K_t:
-                                edit_mode_chosen_tile = edit_mode_chosen_tile + 1
-                                if edit_mode_chosen_tile >= len(tile_kinds):
-                                    edit_mode_chosen_tile -= len(tile_kinds)
-
-            # If the enemy died, end the battle.
-            if player.is_in_battle() and player.get_opponent().is_dead():
-                player.get_opponent().reward(player)
-                player.leave_menu()
-                player.leave_battle()
-                enemy = None
-
-            if player.time_has_passed():
-                player.stop_time()
-
-                game.time = (game.time + 1) % day_length
-
-                # Update the sky
-                if game.time < 60 * 6 or game.time >= 60 * 19:
-                    skybox = night_sky
-                else:
-                    skybox = day_sky
-
-                # If the player is in battle, let the enemy attack
-                # and summon the menu.
-                if player.is_in_battle():
-                    player.get_opponent().engage(player)
-
-                # Start a random encounter, randomly.
-                if (not player.is_in_battle()
-                        and world.at(player.x, player.y) != 5
-                        and random.randint(0, 30) == 0):
-                    index = random.randint(0,3)
-
-                    if index == 0:
-                        player.enter_battle(Rat())
-                    elif index == 1:
-                        player.enter_battle(Proselytizer())
-                    elif index == 2:
-                        player.enter_battle(Jyesula())
-                    else:
-                        player.enter_battle(Guard())
-
-                    player.enter_menu()
-
-            # If the player is in battle, tick the enemy.
-            if player.is_in_battle():
-                player.get_opponent().tick()
+                        if event.key == K_p:
+                            # Edit tile ahead
+                            ox, oy = dir_as_offset(player.facing)
+                            tx, ty = player.x + ox, player.y + oy
+                            world.set_at(tx, ty, edit_mode_chosen_tile)
+                        elif event.key == K_h:
+                            edit_mode_chosen_tile = edit_mode_chosen_tile - 1
+                            if edit_mode_chosen_tile < 0:
+                                edit_mode_chosen_tile += len(tile_kinds)
+                        elif event.key == K_t:
+                            edit_mode_chosen_tile = edit_mode_chosen_tile + 1
+                            if edit_mode_chosen_tile >= len(tile_kinds):
+                                edit_mode_chosen_tile -= len(tile_kinds)
+
+            profiler.end('events')
+
+            # Let the game go on.
+            profiler.begin('update')
+            state.allow_edit = allow_edit
+            state.update()
+
+            # Update the sky
+            if state.is_night():
+                skybox = night_sky
+            else:
+                skybox = day_sky
+            profiler.end('update')
 
             # End the game if the user has died.
             if player.is_dead():
                 done = True
         elif current_mode == MODE_DEV_CONSOLE:
-            for e in pygame.event.get():
+            for e in get_frame_events(frame_counter, True):
                 if e.type == pygame.QUIT:
                     done = True
                 elif e.type == pygame.KEYDOWN:
@@ -698,6 +853,10 @@ def main():
                                 dev_console_print('  TELEPORT <x> <y>')
                                 dev_console_print('  SETDAYSKY <prefix>')
                                 dev_console_print('  SETNIGHTSKY <prefix>')
+                                dev_console_print('  RESCAN')
+                                dev_console_print('  CACHESTATS')
+                                dev_console_print('  PROFILE')
+                                dev_console_print('  SAVETRACE <filename>')
                                 dev_console_print('Press backtick(`) to return to the game.')
                             elif args[0] == 'allowedit':
                                 allow_edit = True
@@ -720,6 +879,10 @@ def main():
                             elif args[0] == 'loadmap':
                                 if len(args) == 2:
                                     world.load(args[1])
+                                    play_world_music(world)
+                                    preload_world(preloader, world)
+                                    wait_for_preloader(window, font, preloader)
+                                    dirty_rects.invalidate()
                                     day_sky[0:4] = load_skybox(world.day_sky_prefix)
                                     night_sky[0:4] = load_skybox(world.night_sky_prefix)
                                     dev_console_print('Loaded map %s' % args[1])
@@ -760,6 +923,26 @@ def main():
                                     dev_console_print('Updated night sky!')
                                 else:
                                     dev_console_print('usage: setnightsky <prefix>')
+                            elif args[0] == 'rescan':
+                                rescan_mods()
+                                dev_console_print('Rescanned mod files')
+                            elif args[0] == 'cachestats':
+                                dev_console_print('Assets: ' + asset_cache.stats())
+                                dev_console_print('Text: ' + text_cache.stats())
+                                from .monsters import monster_pool
+                                dev_console_print('Monsters: ' + monster_pool.stats())
+                            elif args[0] == 'profile':
+                                profiler.overlay_enabled = not profiler.overlay_enabled
+                                if profiler.overlay_enabled:
+                                    dev_console_print('Profiler overlay on')
+                                else:
+                                    dev_console_print('Profiler overlay off')
+                            elif args[0] == 'savetrace':
+                                if len(args) == 2:
+                                    profiler.export_chrome_trace(args[1])
+                                    dev_console_print('Saved trace to %s' % args[1])
+                                else:
+                                    dev_console_print('usage: savetrace <filename>')
                             else:
                                 dev_console_print('Bzzzrt! Type HELP for instructions.')
 
@@ -771,18 +954,51 @@ def main():
                             ch = ch.upper()
                         dev_console_input += ch
 
-            window.fill((0, 0, 0))
-            
-            # Draw the output of previous commands
-            for i in range(len(dev_console_lines)):
-                line = dev_console_lines[-1 - i]
-                draw_text(font, line, (255, 255, 255), window, 0, window.get_height() - (i+2) * font.get_linesize())
-
-            # Draw the command that is being typed in
-            draw_text(font, dev_console_input + '|', (255, 255, 255), window, 0, window.get_height() - font.get_linesize())
-            
-            pygame.display.flip()
+            # Find out whether the console changed.
+            if current_mode != drawn_mode:
+                dirty_rects.invalidate()
+                drawn_mode = current_mode
+
+            dirty_rects.mark('console', window.get_rect(),
+                             (tuple(dev_console_lines), dev_console_input))
+
+            rects = dirty_rects.pop_rects()
+            if (replay is None or replay_draw) and (not use_dirty_rects or rects):
+                profiler.begin('console')
+                window.fill((0, 0, 0))
+
+                # Draw the output of previous commands
+                for i in range(len(dev_console_lines)):
+                    line = dev_console_lines[-1 - i]
+                    draw_text(font, line, (255, 255, 255), window, 0, window.get_height() - (i+2) * font.get_linesize())
+
+                # Draw the command that is being typed in
+                draw_text(font, dev_console_input + '|', (255, 255, 255), window, 0, window.get_height() - font.get_linesize())
+                profiler.end('console')
+
+                profiler.begin('present')
+                if use_dirty_rects:
+                    pygame.display.update(rects)
+                else:
+                    pygame.display.flip()
+                profiler.end('present')
+
+        profiler.end_frame()
         
-        # Delay until the next frame.
-        clock.tick(40)
+        if replay is not None:
+            # Play the replay as fast as possible, and stop where it ends.
+            frame_times.append(time.perf_counter() - frame_start)
+            if replay.is_over(frame_counter):
+                done = True
+        else:
+            # Delay until the next frame.
+            clock.tick(40)
+
+    if recorder is not None:
+        recorder.finish(frame_counter, state_checksum(state))
+    if replay is not None:
+        print_replay_report(frame_times)
+        if replay.checksum is not None and replay.checksum != state_checksum(state):
+            print('The replay did not play out like the recording did.')
 
+    preloader.shutdown()
@@ -0,0 +1,77 @@
+"""
+The dirtyrects module keeps track of which parts of the screen changed.
+"""
+import pygame
+
+class DirtyRects(object):
+    """
+    DirtyRects remembers what was last drawn in each named region of the
+    screen so that only the regions which changed need to be redrawn and
+    pushed to the display.
+
+    Every frame, describe each region with a rect and a key.  The key
+    can be anything comparable which captures what the region shows.
+    If the rect or the key differs from the last frame, the region is
+    dirty.  A region which is no longer marked is dirty once more, so
+    that whatever covers its rect is drawn over it:
+
+        dirty_rects = DirtyRects(window.get_rect())
+
+        # Main loop
+        while True:
+            dirty_rects.mark('clock', clock_rect, clock_text)
+            dirty_rects.mark('hearts', hearts_rect, player.health)
+
+            rects = dirty_rects.pop_rects()
+            if rects:
+                ...draw the frame...
+                pygame.display.update(rects)
+    """
+    def __init__(self, screen_rect):
+        """
+        Create a new DirtyRects object for a screen covering SCREEN_RECT,
+        where everything is dirty.
+        """
+        self.screen_rect = pygame.Rect(screen_rect)
+        self.regions = {}
+        self.rects = [self.screen_rect]
+
+        # The regions which were marked since the rects were last popped.
+        self.marked = set()
+
+    def mark(self, name, rect, key):
+        """
+        Describe the region NAME as covering RECT and showing KEY.
+
+        If it changed since it was last marked, both its old and new
+        rects are added to the dirty rects.
+        """
+        rect = pygame.Rect(rect)
+        old = self.regions.get(name)
+        self.marked.add(name)
+
+        if old is None or old[0] != rect or old[1] != key:
+            if old is not None:
+                self.rects.append(old[0])
+            self.rects.append(rect)
+            self.regions[name] = (rect, key)
+
+    def invalidate(self):
+        """
+        Make the whole screen dirty, and forget every region so that they
+        are all dirty when next marked.
+        """
+        self.regions = {}
+        self.rects.append(self.screen_rect)
+
+    def pop_rects(self):
+        "Return the rects that became dirty since the last call and clear them."
+        # Regions which were not marked this time are dirty one last time.
+        for name in list(self.regions):
+            if name not in self.marked:
+                self.rects.append(self.regions.pop(name)[0])
+        self.marked = set()
+
+        rects = self.rects
+        self.rects = []
+        return rects
@@ -0,0 +1,128 @@
+'''Approximate string matching, for making sense of typos in player input.'''
+
+from collections import defaultdict
+
+def edit_distance(a, b, limit):
+    '''Return the number of edits it takes to turn *a* into *b*, where an
+    edit inserts, deletes or replaces a character, or swaps two adjacent
+    ones.
+
+    :param str a: A string
+    :param str b: Another string
+    :param int limit: The largest distance of interest
+    :returns: The distance, or *limit* + 1 if it is greater than *limit*
+    :rtype: int
+    '''
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    before = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1,
+                             current[j - 1] + 1,
+                             previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+
+    return min(previous[-1], limit + 1)
+
+def trigrams(word):
+    '''Return the set of three-character pieces of *word*, padded at both
+    ends so that short words and the ends of words have trigrams too.
+
+    :param str word: A string
+    :rtype: set of strings
+    '''
+    padded = '  %s  ' % word
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+class TrigramIndex(object):
+    '''A TrigramIndex finds the closest of a set of strings to a query
+    without comparing the query with every string.
+
+    Strings which are only a few edits apart share most of their
+    trigrams, so only strings which share enough trigrams with the query
+    (or, for short queries, which are about as long as it) are compared
+    with it.
+
+    :ivar values: The value stored with each string
+    :vartype values: dict
+    '''
+    def __init__(self):
+        self.values = {}
+
+        # Maps each string to its trigrams, each trigram to the strings
+        # that have it, and each length to the strings that are that long.
+        self._trigrams = {}
+        self._by_trigram = defaultdict(list)
+        self._by_length = defaultdict(list)
+
+    def add(self, key, value):
+        '''Add the string *key* with *value*, unless *key* was already added.'''
+        if key in self.values:
+            return
+        self.values[key] = value
+        self._trigrams[key] = trigrams(key)
+        for trigram in self._trigrams[key]:
+            self._by_trigram[trigram].append(key)
+        self._by_length[len(key)].append(key)
+
+    def _candidates(self, query, max_distance):
+        '''Return the strings which might be within *max_distance* of *query*.'''
+        # Each edit spoils at most four of the query's trigrams (a swap
+        # does), so a string within max_distance edits of the query has at
+        # least this many of the query's trigrams.
+        query_trigrams = trigrams(query)
+        needed = len(query_trigrams) - 4 * max_distance
+
+        if needed <= 0:
+            candidates = []
+            for length in range(len(query) - max_distance,
+                                len(query) + max_distance + 1):
+                candidates.extend(self._by_length.get(length, ()))
+            return candidates
+
+        # A string with that many of the query's trigrams has at least one
+        # of any len(query_trigrams) - needed + 1 of them, so only look
+        # through the strings with the rarest ones.
+        rarest = sorted(query_trigrams,
+                        key=lambda trigram: len(self._by_trigram.get(trigram, ())))
+        candidates = set()
+        for trigram in rarest[:len(query_trigrams) - needed + 1]:
+            candidates.update(self._by_trigram.get(trigram, ()))
+        return [key for key in candidates
+                if len(self._trigrams[key] & query_trigrams) >= needed]
+
+    def closest(self, query, max_distance, unique=False):
+        '''Find the string closest to *query*.
+
+        :param str query: The string to look for
+        :param int max_distance: How many edits away from *query* the
+                                 string may be
+        :param bool unique: Whether to give up when the strings within
+                            *max_distance* edits have different values
+        :returns: A tuple (key, value) for the closest string, preferring
+                  the smallest value on ties, or None if there is no
+                  string within *max_distance* edits (or, if *unique*,
+                  no single value that they all have)
+        '''
+        best = None
+        values = set()
+        for key in self._candidates(query, max_distance):
+            distance = edit_distance(query, key, max_distance)
+            if distance <= max_distance:
+                values.add(self.values[key])
+                rank = (distance, self.values[key])
+                if best is None or rank < best[0]:
+                    best = (rank, key)
+
+        if best is None or (unique and len(values) > 1):
+            return None
+        return best[1], self.values[best[1]]
@@ -0,0 +1,359 @@
+"""
+The game module holds the rules of the game, without any rendering or input.
+
+A :class:`GameState` can be stepped with abstract actions, so the game
+can be played by the pygame front end in :mod:`dirt.dirt` as well as by
+headless simulations:
+
+    from dirt import utils
+    from dirt.game import GameState, Player, ACTION_UP
+
+    utils.media_enabled = False
+    state = GameState(world, tile_kinds, Player(12, 16))
+    while not state.player.is_dead():
+        state.step(ACTION_UP)
+        state.skip_animations()
+"""
+import random
+from collections import namedtuple
+
+# Cardinal directions
+NORTH    = 0
+EAST     = 1
+SOUTH    = 2
+WEST     = 3
+NUM_DIRS = 4
+
+# Actions that the player can take.  They are what the arrow keys and the
+# Enter key do: walk and turn, or move around the menu and choose.
+ACTION_UP      = 'up'
+ACTION_DOWN    = 'down'
+ACTION_LEFT    = 'left'
+ACTION_RIGHT   = 'right'
+ACTION_CONFIRM = 'confirm'
+
+# How many minutes there are in a day.
+DAY_LENGTH = 60 * 24
+
+# The tile on which random encounters never happen.
+SAFE_TILE = 5
+
+# How likely a random encounter is each minute: one in ENCOUNTER_ODDS.
+ENCOUNTER_ODDS = 31
+
+# Define the different kinds of tile.
+# Fields:
+#   substrate - what tile's image should be drawn under this (or None)
+#   is_beneath - whether the tile should be draw under other tiles
+#   is_solid - whether the player can walk through this tile
+#   img - the path to the tile's image
+TileKind = namedtuple('TileKind', 'substrate is_beneath is_solid img')
+
+class Player:
+    def __init__(self, x, y):
+        self.health = 3
+        self.max_health = 3
+        self.money = 3
+        self.facing = SOUTH
+        self.opponent = None
+        self.in_menu = False
+        self.conversation = None
+        self.in_conversation = False
+        self.time_passed = False
+        self.x = x
+        self.y = y
+
+    def stop_time(self):
+        """
+        Make time considered to be "not passed".
+
+        This must happen after time passes (when the user walks,
+        attacks, etc.) so that time does not endlessly keep passing.
+        """
+        self.time_passed = False
+
+    def pass_time(self):
+        """
+        Make time considered to be "passed".
+
+        This has many effects:
+
+        * The game clock advances by one minute.
+        * Enemies re-engage the player if they are in battle.
+        * A random encounter might happen.
+        """
+        self.time_passed = True
+
+    def time_has_passed(self):
+        'Return whether time is considered to be "passed".'
+        return self.time_passed
+
+    def take_damage(self, amount):
+        "Make the player take an AMOUNT of damage."
+        self.health = max(0, self.health - amount)
+
+    def gain_money(self, amount):
+        "Make the player gain an AMOUNT of money."
+        self.money += amount
+
+    def lose_money(self, amount):
+        "Make the player lose an AMOUNT of money."
+        self.money = max(0, self.money - amount)
+
+    def is_dead(self):
+        "Return whether the player is dead."
+        return self.health <= 0
+
+    def leave_battle(self):
+        "Make the player leave the current battle."
+        self.opponent = None
+
+    def leave_menu(self):
+        "Make the player leave the current menu."
+        self.in_menu = False
+
+    def is_in_battle(self):
+        "Return whether the player is in a battle."
+        return self.opponent is not None
+
+    def is_in_menu(self):
+        "Return whether the player is in a menu."
+        return self.in_menu
+
+    def is_in_conversation(self):
+        "Return whether the player is in a new-style conversation."
+        return self.in_conversation
+    
+    def enter_battle(self, opponent):
+        "Make the player enter battle."
+        self.opponent = opponent
+
+    def enter_menu(self):
+        "Make the player enter the menu."
+        self.in_menu = True
+
+    def attack(self, enemy):
+        "Make the player attack an enemy."
+        enemy.take_damage(1)
+
+    def get_opponent(self):
+        "Return the player's opponent."
+        return self.opponent
+
+def load_mods():
+    """
+    Register the mods listed in modlist.txt.
+
+    Their monsters and encounter tables are loaded as well.
+
+    :returns: a dict of the :class:`TileKind` of each tile number
+    """
+    from .utils import get_resource_stream, register_mod
+    from .monsters import load_monster_config, check_encounter_tables
+
+    tile_kinds = {}
+    with get_resource_stream('modlist.txt') as f:
+        for line in f:
+            line = line.decode('utf-8')
+            mod_name = line.strip()
+            if mod_name:
+                cfg = register_mod(mod_name)
+                load_monster_config(cfg, mod_name)
+                if 'tiles' in cfg:
+                    for tile_id, tile in cfg['tiles'].items():
+                        if 'substrate' not in tile:
+                            tile['substrate'] = None
+                        
+                        tile_kinds[int(tile_id)] = TileKind(substrate=tile['substrate'],
+                                                            is_beneath=tile['is_beneath'],
+                                                            is_solid=tile['is_solid'],
+                                                            img=tile['img'])
+
+    check_encounter_tables()
+    return tile_kinds
+
+def dir_as_offset(direction):
+    if direction == NORTH:
+        return 0, -1
+    elif direction == EAST:
+        return 1, 0
+    elif direction == SOUTH:
+        return 0, 1
+    elif direction == WEST:
+        return -1, 0
+
+def is_night(time):
+    "Return whether the minute of the day TIME is at night."
+    return time < 60 * 6 or time >= 60 * 19
+
+def make_random_monster(rng, tile=None):
+    """
+    Return a monster for a random encounter on TILE, chosen with RNG from
+    the tile's encounter table, or None if nothing lives there.  The
+    monster comes from :data:`dirt.monsters.monster_pool`, and should be
+    released to it when the battle is over.
+    """
+    from .monsters import monster_pool, encounter_table
+    table = encounter_table(tile)
+    name = table.choose(rng) if table is not None else None
+    if name is None:
+        return None
+    return monster_pool.acquire(name, rng)
+
+class GameState(object):
+    """
+    A GameState holds everything about a game in progress and applies the
+    rules of the game to it.
+
+    :ivar world: the :class:`dirt.world.World` being played in
+    :ivar dict tile_kinds: the :class:`TileKind` of each tile number
+    :ivar Player player: the player
+    :ivar int time: the current minute of the in-game day
+    :ivar int selection: the selected option in the battle menu
+    :ivar bool allow_edit: whether the player walks through walls
+                           without time passing, for editing maps
+    :ivar rng: where random numbers come from; anything with a
+               randint method, such as the random module
+    """
+    def __init__(self, world, tile_kinds, player, rng=None):
+        """Create a new GameState."""
+        self.world = world
+        self.tile_kinds = tile_kinds
+        self.player = player
+        self.time = 60 * 5
+        self.selection = 0
+        self.allow_edit = False
+        self.rng = rng if rng is not None else random
+
+    def is_night(self):
+        "Return whether it is night in the game."
+        return is_night(self.time)
+
+    def apply(self, action):
+        """
+        Apply an ACTION of the player's.
+
+        :returns: the (x, y) position of the solid tile that the player
+                  walked into, if any, so that the front end can react
+                  to doors and the like; otherwise None
+        """
+        player = self.player
+
+        if player.is_in_menu() and player.is_in_battle():
+            # Handle battle menu navigation and choosing.
+            enemy = player.get_opponent()
+
+            if self.selection >= len(enemy.get_options(player)):
+                self.selection = max(0, len(enemy.get_options(player)) - 1)
+
+            if action == ACTION_UP:
+                if self.selection > 0:
+                    self.selection -= 1
+            elif action == ACTION_DOWN:
+                if self.selection < len(enemy.get_options(player)) - 1:
+                    self.selection += 1
+            elif action == ACTION_CONFIRM and enemy.get_options(player):
+                # Select the current menu item.
+                enemy.suffer(player,
+                             enemy.get_options(player)[self.selection])
+        elif action == ACTION_CONFIRM:
+            if player.is_in_battle():
+                player.enter_menu()
+        elif action == ACTION_RIGHT:
+            # Turn the player right.
+            player.facing = (player.facing + 1) % NUM_DIRS
+        elif action == ACTION_LEFT:
+            # Turn the player left.
+            player.facing = (player.facing - 1) % NUM_DIRS
+        elif action == ACTION_UP:
+            # Attempt to move the player forward.
+            offset = dir_as_offset(player.facing)
+            target = (player.x + offset[0], player.y + offset[1])
+            if target[0] >= 0 and target[0] < self.world.width and \
+               target[1] >= 0 and target[1] < self.world.height:
+                if self.allow_edit or not self.tile_kinds[self.world.at(*target)].is_solid:
+                    self._walk(offset)
+                else:
+                    return target
+        elif action == ACTION_DOWN:
+            # Attempt to move the player backward.
+            offset = dir_as_offset(player.facing)
+            if self.allow_edit or not self.tile_kinds[self.world.at(player.x - offset[0],
+                                                                    player.y - offset[1])].is_solid:
+                self._walk((-offset[0], -offset[1]))
+
+        return None
+
+    def _walk(self, offset):
+        "Move the player by OFFSET."
+        player = self.player
+        player.x += offset[0]
+        player.y += offset[1]
+        if not self.allow_edit:
+            player.pass_time()
+
+        if player.is_in_battle():
+            player.get_opponent().follow(player)
+
+    def update(self):
+        """
+        Advance the game by one frame: end won battles, let time pass
+        if the player did something, and animate the opponent.
+        """
+        player = self.player
+
+        # If the enemy died, end the battle.
+        if player.is_in_battle() and player.get_opponent().is_dead():
+            from .monsters import monster_pool
+            opponent = player.get_opponent()
+            opponent.reward(player)
+            player.leave_menu()
+            player.leave_battle()
+            monster_pool.release(opponent)
+
+        if player.time_has_passed():
+            player.stop_time()
+
+            self.time = (self.time + 1) % DAY_LENGTH
+
+            # If the player is in battle, let the enemy attack
+            # and summon the menu.
+            if player.is_in_battle():
+                player.get_opponent().engage(player)
+
+            # Start a random encounter, randomly.
+            tile = self.world.at(player.x, player.y)
+            if (not player.is_in_battle()
+                    and tile != SAFE_TILE
+                    and self.rng.randint(0, ENCOUNTER_ODDS - 1) == 0):
+                monster = make_random_monster(self.rng, tile)
+                if monster is not None:
+                    player.enter_battle(monster)
+                    player.enter_menu()
+
+        # If the player is in battle, tick the enemy.
+        if player.is_in_battle():
+            player.get_opponent().tick()
+
+    def step(self, action=None):
+        """
+        Apply ACTION, if any, and then advance the game by one frame.
+
+        :returns: the same as :meth:`apply`
+        """
+        target = None
+        if action is not None:
+            target = self.apply(action)
+        self.update()
+        return target
+
+    def is_animating(self):
+        "Return whether the opponent is in the middle of saying something."
+        player = self.player
+        return player.is_in_battle() and \
+               player.get_opponent().mouth.is_talking()
+
+    def skip_animations(self):
+        "Advance the game until the opponent is done talking."
+        while self.is_animating():
+            self.update()
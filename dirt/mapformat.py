@@ -0,0 +1,177 @@
+"""
+The mapformat module reads and writes map files.
+
+Maps come in two formats:
+
+* JSON maps (``.json``) hold the width, height, tiles and metadata of the
+  map in one JSON object.  They are easy to read and edit by hand.
+* Binary maps (``.dmap``) start with a small header, followed by the
+  metadata as JSON and then one byte per tile.  They are memory-mapped
+  when loaded, so opening a map is quick no matter how big it is, and
+  only the parts of the map that are looked at are read from disk.
+
+Both formats can be converted to each other with :func:`convert_map`.
+"""
+import json
+import mmap
+import struct
+from array import array
+
+# The array typecode used to store tiles: one unsigned byte per tile.
+TILE_TYPECODE = 'B'
+
+# The file extension of binary maps.
+BINARY_MAP_EXTENSION = '.dmap'
+
+# The header of a binary map: magic, version, width, height and the
+# length of the metadata which follows it.
+_MAGIC = b'DIRTMAP\0'
+_VERSION = 1
+_header = struct.Struct('<8sHIII')
+
+# The suffix of the edit journal that is kept next to a saved map.
+JOURNAL_SUFFIX = '.journal'
+
+# A journal entry: the x and y of a tile and its new value.
+_journal_entry = struct.Struct('<IIB')
+
+# The metadata keys that are stored in both formats.
+METADATA_KEYS = ('bgm', 'day_sky_prefix', 'night_sky_prefix')
+
+def is_binary_map(filename):
+    "Return whether FILENAME names a binary map."
+    return filename.lower().endswith(BINARY_MAP_EXTENSION)
+
+def read_json_map(f):
+    """
+    Read a JSON map from a binary stream.
+
+    :param f: a binary file-like stream
+    :returns: a tuple (width, height, tiles, metadata), where tiles is an
+              array of bytes and metadata is a dict
+    """
+    j = json.loads(f.read().decode('utf-8'))
+    metadata = dict((key, j[key]) for key in METADATA_KEYS)
+    return j['width'], j['height'], array(TILE_TYPECODE, j['tiles']), metadata
+
+def write_json_map(f, width, height, tiles, metadata):
+    """
+    Write a JSON map to a text stream.
+
+    :param f: a text file-like stream
+    :param int width: the width of the map
+    :param int height: the height of the map
+    :param tiles: the tiles of the map, row by row
+    :param dict metadata: the values of :data:`METADATA_KEYS`
+    """
+    j = dict((key, metadata[key]) for key in METADATA_KEYS)
+    j['width'] = width
+    j['height'] = height
+    j['tiles'] = list(tiles)
+    json.dump(j, f)
+
+def read_binary_map(f):
+    """
+    Read a binary map from a binary stream.
+
+    If the stream is backed by a real file, the tiles are memory-mapped
+    copy-on-write: changing them does not change the file.  Otherwise,
+    the tiles are read into memory.
+
+    :param f: a binary file-like stream
+    :returns: a tuple (width, height, tiles, metadata), where tiles is a
+              writable buffer of bytes and metadata is a dict
+    """
+    header = f.read(_header.size)
+    if len(header) < _header.size:
+        raise ValueError('Truncated map header')
+
+    magic, version, width, height, metadata_len = _header.unpack(header)
+    if magic != _MAGIC:
+        raise ValueError('Not a binary map')
+    if version != _VERSION:
+        raise ValueError('Unsupported binary map version: %d' % version)
+
+    metadata = json.loads(f.read(metadata_len).decode('utf-8'))
+
+    offset = _header.size + metadata_len
+    size = width * height
+
+    try:
+        fileno = f.fileno()
+    except (AttributeError, OSError):
+        fileno = None
+
+    if fileno is not None and size > 0:
+        m = mmap.mmap(fileno, 0, access=mmap.ACCESS_COPY)
+        if len(m) < offset + size:
+            raise ValueError('Truncated map tiles')
+        tiles = memoryview(m)[offset:offset + size]
+    else:
+        tiles = array(TILE_TYPECODE, f.read(size))
+        if len(tiles) < size:
+            raise ValueError('Truncated map tiles')
+
+    return width, height, tiles, metadata
+
+def write_binary_map(f, width, height, tiles, metadata):
+    """
+    Write a binary map to a binary stream.
+
+    :param f: a binary file-like stream
+    :param int width: the width of the map
+    :param int height: the height of the map
+    :param tiles: the tiles of the map, row by row
+    :param dict metadata: the values of :data:`METADATA_KEYS`
+    """
+    metadata = dict((key, metadata[key]) for key in METADATA_KEYS)
+    metadata = json.dumps(metadata).encode('utf-8')
+
+    f.write(_header.pack(_MAGIC, _VERSION, width, height, len(metadata)))
+    f.write(metadata)
+    for y in range(height):
+        f.write(bytes(tiles[y * width:(y + 1) * width]))
+
+def read_journal(f):
+    """
+    Read the edits in a map's edit journal.
+
+    An incomplete entry at the end of the journal (left by a crash while
+    it was being written) is ignored.
+
+    :param f: a binary file-like stream
+    :returns: a list of (x, y, num) tuples, oldest first
+    """
+    data = f.read()
+    size = _journal_entry.size
+    return [_journal_entry.unpack_from(data, offset)
+            for offset in range(0, len(data) - size + 1, size)]
+
+def write_journal(f, edits):
+    """
+    Append edits to a map's edit journal.
+
+    :param f: a binary file-like stream, opened for appending
+    :param edits: an iterable of (x, y, num) tuples
+    """
+    f.write(b''.join(_journal_entry.pack(x, y, num)
+                     for x, y, num in edits))
+
+def convert_map(src, dst):
+    """
+    Convert the map at path SRC to the format of path DST.
+
+    The format of each file is decided by its extension.
+    """
+    with open(src, 'rb') as f:
+        if is_binary_map(src):
+            width, height, tiles, metadata = read_binary_map(f)
+        else:
+            width, height, tiles, metadata = read_json_map(f)
+
+    if is_binary_map(dst):
+        with open(dst, 'wb') as f:
+            write_binary_map(f, width, height, tiles, metadata)
+    else:
+        with open(dst, 'w') as f:
+            write_json_map(f, width, height, tiles, metadata)
@@ -1,4 +1,4 @@
-from .guard import Guard
-from .jyesula import Jyesula
-from .proselytizer import Proselytizer
-from .rat import Rat
+from .pool import MonsterPool, monster_pool
+from .templates import MonsterTemplate, EncounterTable, compile_monster, \
+     load_monster_config, check_encounter_tables, encounter_table, \
+     monster_templates
@@ -0,0 +1,130 @@
+import random
+from dirt.components.combat import CombatComponent
+from dirt.components.dialogue import DialogueComponent
+from dirt.components.body import BodyComponent
+from .templates import OP_SAY, OP_FAREWELL, OP_SURRENDER, OP_PASS_TIME, \
+     OP_GAIN_MONEY, OP_LOSE_MONEY, OP_SET, OP_CLEAR, OP_IF, HAS_MONEY
+
+class Monster(object):
+    """
+    A Monster is fought in battle, and behaves as its
+    :class:`dirt.monsters.templates.MonsterTemplate` says.
+
+    :ivar rng: where the monster's random numbers come from; anything with
+               a ``randint`` method, like the game's
+    """
+    __slots__ = ('template', 'combativeness', 'mouth', 'appearance', 'flags',
+                 'rng', 'pool_name')
+
+    def __init__(self, template, rng=None):
+        self.template = template
+        self.combativeness = CombatComponent()
+        self.mouth = DialogueComponent(color=template.color)
+        self.appearance = BodyComponent(path=template.sprite)
+        self.flags = set()
+
+        self.combativeness.add_attack_hook(self.on_attack)
+        self.combativeness.add_ignore_hook(self.on_ignore)
+        self.combativeness.add_death_hook(self.on_death)
+
+        self.reset(rng)
+
+    def reset(self, rng=None):
+        """
+        Make the monster as good as new, for another encounter where its
+        random numbers come from RNG, or the random module if it is None.
+        """
+        self.rng = rng if rng is not None else random
+        self.combativeness.reset(health=self.template.health,
+                                 power=self.template.power)
+        self.mouth.reset()
+        self.flags.clear()
+
+        self.run(self.template.greet, None)
+
+    def run(self, program, player):
+        "Carry out a compiled PROGRAM of actions against PLAYER."
+        for opcode, arg in program:
+            if opcode == OP_SAY:
+                if len(arg) == 1:
+                    self.mouth.say(arg[0])
+                else:
+                    self.mouth.say(arg[self.rng.randint(0, len(arg) - 1)])
+            elif opcode == OP_FAREWELL:
+                self.mouth.farewell(arg)
+            elif opcode == OP_SURRENDER:
+                self.combativeness.skip_turn()
+                self.combativeness.surrender()
+            elif opcode == OP_PASS_TIME:
+                player.pass_time()
+            elif opcode == OP_GAIN_MONEY:
+                player.gain_money(self.rng.randint(arg[0], arg[1]))
+            elif opcode == OP_LOSE_MONEY:
+                player.lose_money(arg)
+            elif opcode == OP_SET:
+                self.flags.add(arg)
+            elif opcode == OP_CLEAR:
+                self.flags.discard(arg)
+            elif opcode == OP_IF:
+                condition, then_program, else_program = arg
+                if self.holds(condition, player):
+                    self.run(then_program, player)
+                else:
+                    self.run(else_program, player)
+
+    def holds(self, condition, player):
+        "Return whether CONDITION holds, for a battle with PLAYER."
+        if condition == HAS_MONEY:
+            return player.money > 0
+        return condition in self.flags
+
+    def reward(self, player):
+        self.run(self.template.reward, player)
+
+    def engage(self, player):
+        self.combativeness.take_turn(player)
+        player.enter_menu()
+
+    def follow(self, player):
+        self.run(self.template.follow, player)
+
+    def draw(self, window):
+        self.appearance.draw(window)
+        self.mouth.draw(window)
+
+    def tick(self):
+        self.mouth.tick()
+
+    def on_attack(self, player):
+        self.run(self.template.attack, player)
+
+    def on_ignore(self, player):
+        self.run(self.template.ignore, player)
+
+    def on_death(self, player):
+        self.run(self.template.death, player)
+
+    def suffer(self, player, option):
+        if self.combativeness.handle_option(option, player):
+            # The option was handled by the combat component.
+            return
+
+        for name, condition, negated, program in self.template.options:
+            if name == option:
+                self.run(program, player)
+                return
+
+    def is_dead(self):
+        return self.combativeness.is_done() and \
+               self.mouth.is_done()
+
+    def get_options(self, player):
+        if self.combativeness.is_done():
+            return []
+
+        options = [name for name, condition, negated, program in self.template.options
+                   if condition is None or self.holds(condition, player) != negated]
+
+        self.combativeness.add_options(options)
+
+        return options
@@ -0,0 +1,90 @@
+"""
+The pool module recycles monsters between battles.
+
+Building a monster builds its components, loads its assets and wires up
+its hooks, all of which would otherwise be thrown away when the battle
+ends.  A :class:`MonsterPool` keeps monsters from finished battles and
+hands them out again, reset, for later encounters:
+
+    rat = monster_pool.acquire('Rat', rng)
+    ...fight the rat...
+    monster_pool.release(rat)
+
+Monsters are made by the factory registered under their name, which is
+called with the random number generator of the battle, and must have a
+``reset(rng)`` method which makes them as good as new for a battle with
+that generator.
+"""
+
+class MonsterPool(object):
+    """
+    A MonsterPool hands out monsters by name, reusing released ones.
+
+    :ivar int max_free: how many released monsters of each name are kept
+    :ivar int created: how many monsters have been built
+    :ivar int reused: how many monsters have been handed out again
+    """
+    def __init__(self, max_free=4):
+        """Create a new MonsterPool."""
+        self.max_free = max_free
+        self.created = 0
+        self.reused = 0
+
+        # Maps the names of monsters to their factories, and to the
+        # released monsters waiting to be reused.
+        self.factories = {}
+        self.free = {}
+
+    def register(self, name, factory):
+        "Make FACTORY(rng) build the monsters called NAME."
+        self.factories[name] = factory
+        self.free[name] = []
+
+    def names(self):
+        "Return the names of the monsters that can be acquired."
+        return list(self.factories)
+
+    def acquire(self, name, rng=None):
+        """
+        Return a monster called NAME, ready for a new battle where its
+        random numbers come from RNG (by default, the random module).
+        """
+        if name not in self.factories:
+            raise ValueError('Unknown monster: %s' % name)
+
+        free = self.free[name]
+        if free:
+            monster = free.pop()
+            monster.reset(rng)
+            self.reused += 1
+        else:
+            monster = self.factories[name](rng)
+            monster.pool_name = name
+            self.created += 1
+        return monster
+
+    def release(self, monster):
+        """
+        Give back MONSTER, whose battle is over, so that it can be reused.
+        Monsters that did not come from this pool are left alone.
+        """
+        free = self.free.get(getattr(monster, 'pool_name', None))
+        if free is None or len(free) >= self.max_free:
+            return
+        if any(m is monster for m in free):
+            return
+        free.append(monster)
+
+    def stats(self):
+        "Return a one-line summary of how the pool is doing."
+        return '%d monsters built, %d reused, %d waiting' % \
+               (self.created, self.reused,
+                sum(len(free) for free in self.free.values()))
+
+    def clear(self):
+        "Forget the released monsters."
+        for free in self.free.values():
+            del free[:]
+
+# The pool of the monsters of random encounters.
+monster_pool = MonsterPool()
@@ -0,0 +1,247 @@
+"""
+The templates module reads the monsters and encounter tables of mods.
+
+A mod's ``config.json`` can describe monsters under ``"monsters"``::
+
+    "monsters": {
+        "Rat": {
+            "health": 1.0,
+            "power": 0.5,
+            "color": [128, 128, 0],
+            "sprite": "data/rat.png",
+            "greet": [{"say": "*sniff*!"}],
+            "attack": [{"say": "*squeak*!"}, {"clear": "pacified"}],
+            "death": [{"farewell": "*squoo*..."}],
+            "options": [
+                {"name": "Bide",
+                 "do": [{"say": "*squeak*?"}, {"set": "pacified"},
+                        {"pass_time": true}]}
+            ]
+        }
+    }
+
+*greet* runs when the monster appears, *attack*, *ignore* and *death*
+when the player attacks it, ignores it or kills it, *follow* when the
+player walks away during the battle, and *reward* when the battle is
+over.  Each is a list of actions:
+
+* ``{"say": text}`` says something, or one of a list of things, chosen
+  at random.
+* ``{"farewell": text}`` says something and ends the battle once it has
+  been said.
+* ``{"surrender": true}`` gives up the monster's next turn and the
+  battle.
+* ``{"pass_time": true}`` lets a minute pass.
+* ``{"gain_money": [low, high]}`` gives the player between LOW and HIGH
+  money, and ``{"lose_money": amount}`` takes some away.
+* ``{"set": flag}`` and ``{"clear": flag}`` set and clear a flag of the
+  monster.  Flags start cleared.
+* ``{"if": flag, "do": [...], "else": [...]}`` does one list of actions
+  or the other, depending on the flag.
+
+Besides the monster's own flags, there is the condition ``has_money``:
+whether the player has any money.
+
+*options* are what the player can do in battle besides attacking and
+ignoring.  An option with ``"if": condition`` or ``"unless": condition``
+is only offered when the condition holds or does not hold.
+
+Random encounters are chosen from weighted tables under
+``"encounters"``.  The ``default`` table is used everywhere, except on
+tiles whose kind names another table with ``"encounters"``::
+
+    "encounters": {
+        "default": [["Rat", 3], ["Guard", 1]],
+        "graveyard": [["Ghost", 1]]
+    }
+
+Definitions are compiled once, when the mod is registered, into
+immutable :class:`MonsterTemplate` tuples, so spawning a monster only
+builds its components.
+"""
+from bisect import bisect_right
+from collections import namedtuple
+from functools import partial
+
+# Opcodes of monster actions.
+OP_SAY        = 0
+OP_FAREWELL   = 1
+OP_SURRENDER  = 2
+OP_PASS_TIME  = 3
+OP_GAIN_MONEY = 4
+OP_LOSE_MONEY = 5
+OP_SET        = 6
+OP_CLEAR      = 7
+OP_IF         = 8
+
+_action_opcodes = {
+    'say': OP_SAY,
+    'farewell': OP_FAREWELL,
+    'surrender': OP_SURRENDER,
+    'pass_time': OP_PASS_TIME,
+    'gain_money': OP_GAIN_MONEY,
+    'lose_money': OP_LOSE_MONEY,
+    'set': OP_SET,
+    'clear': OP_CLEAR,
+    'if': OP_IF,
+}
+
+# The condition which holds when the player has money.
+HAS_MONEY = 'has_money'
+
+# The encounter table used on tiles that do not name one.
+DEFAULT_ENCOUNTERS = 'default'
+
+# A compiled monster definition.
+# Fields:
+#   name - the name of the monster
+#   health, power - the monster's combat stats
+#   color - the color of what the monster says
+#   sprite - the path to the monster's image
+#   greet, attack, ignore, death, follow, reward - the programs run on
+#       each event, as tuples of (opcode, argument)
+#   options - the battle options, as tuples of (name, condition,
+#       whether the condition is negated, program)
+MonsterTemplate = namedtuple('MonsterTemplate',
+                             'name health power color sprite greet attack '
+                             'ignore death follow reward options')
+
+# The events of a monster that run programs.
+_EVENTS = ('greet', 'attack', 'ignore', 'death', 'follow', 'reward')
+
+def _compile_actions(actions, where):
+    "Compile a list of actions into a tuple of (opcode, argument) tuples."
+    program = []
+    for action in actions:
+        if 'if' in action:
+            program.append((OP_IF, (action['if'],
+                                    _compile_actions(action.get('do', []), where),
+                                    _compile_actions(action.get('else', []), where))))
+            continue
+
+        if len(action) != 1 or list(action)[0] not in _action_opcodes:
+            raise ValueError('Unknown action in %s: %r' % (where, action))
+        name, arg = list(action.items())[0]
+        opcode = _action_opcodes[name]
+
+        if opcode == OP_SAY:
+            arg = (arg,) if isinstance(arg, str) else tuple(arg)
+        elif opcode == OP_GAIN_MONEY:
+            arg = tuple(arg)
+        program.append((opcode, arg))
+    return tuple(program)
+
+def compile_monster(name, j):
+    """
+    Compile the definition J of the monster NAME.
+
+    :param str name: the name of the monster
+    :param dict j: the monster's definition, parsed from JSON
+    :rtype: MonsterTemplate
+    """
+    where = 'monster %s' % name
+    programs = dict((event, _compile_actions(j.get(event, []), where))
+                    for event in _EVENTS)
+
+    options = []
+    for option in j.get('options', []):
+        if 'unless' in option:
+            condition, negated = option['unless'], True
+        else:
+            condition, negated = option.get('if'), False
+        options.append((option['name'], condition, negated,
+                        _compile_actions(option['do'], where)))
+
+    return MonsterTemplate(name=name,
+                           health=j['health'],
+                           power=j['power'],
+                           color=tuple(j.get('color', (0, 0, 0))),
+                           sprite=j['sprite'],
+                           options=tuple(options),
+                           **programs)
+
+class EncounterTable(object):
+    """
+    An EncounterTable chooses monsters at random, each with its own
+    weight.
+
+    :ivar tuple names: the names of the monsters
+    :ivar tuple weights: the weight of each monster
+    :ivar str mod: the name of the mod that defined the table, if known
+    """
+    __slots__ = ('names', 'weights', 'mod', '_bounds')
+
+    def __init__(self, entries, mod=None):
+        """Create a new EncounterTable of (name, weight) ENTRIES from MOD."""
+        self.mod = mod
+        self.names = tuple(name for name, weight in entries)
+        self.weights = tuple(int(weight) for name, weight in entries)
+        if any(weight < 0 for weight in self.weights):
+            raise ValueError('Negative encounter weight: %r' % (entries,))
+
+        # The running totals of the weights.
+        bounds = []
+        total = 0
+        for weight in self.weights:
+            total += weight
+            bounds.append(total)
+        self._bounds = tuple(bounds)
+
+    def choose(self, rng):
+        "Return the name of a monster chosen with RNG, or None if there are none."
+        if not self._bounds or self._bounds[-1] == 0:
+            return None
+        roll = rng.randint(0, self._bounds[-1] - 1)
+        return self.names[bisect_right(self._bounds, roll)]
+
+# The templates of the monsters of all mods, by name.
+monster_templates = {}
+
+# The encounter tables of all mods, by name, and the name of the table
+# of each tile number that has its own.
+encounter_tables = {}
+tile_encounters = {}
+
+def load_monster_config(cfg, mod_name=None):
+    """
+    Compile the monsters and encounter tables of the config CFG of the
+    mod MOD_NAME and make them available.  Later mods override earlier
+    ones.
+    """
+    from .pool import monster_pool
+
+    for name, j in cfg.get('monsters', {}).items():
+        template = compile_monster(name, j)
+        monster_templates[name] = template
+        monster_pool.register(name, partial(_spawn, template))
+
+    for name, entries in cfg.get('encounters', {}).items():
+        encounter_tables[name] = EncounterTable(entries, mod_name)
+
+    for tile_id, tile in cfg.get('tiles', {}).items():
+        if 'encounters' in tile:
+            tile_encounters[int(tile_id)] = tile['encounters']
+
+def check_encounter_tables():
+    """
+    Make sure that every monster in the encounter tables exists, once
+    all mods are loaded, rather than when one is first met.
+
+    :raises ValueError: if a table names a monster that no mod defines
+    """
+    for name, table in encounter_tables.items():
+        for monster in table.names:
+            if monster not in monster_templates:
+                raise ValueError('Unknown monster in encounter table %s of mod %s: %s'
+                                 % (name, table.mod, monster))
+
+def _spawn(template, rng):
+    "Return a new monster made from TEMPLATE, which draws from RNG."
+    # The monster code, and the components it is built from, are only
+    # imported when the first monster appears.
+    from .monster import Monster
+    return Monster(template, rng)
+
+def encounter_table(tile):
+    "Return the EncounterTable for random encounters on TILE, or None."
+    return encounter_tables.get(tile_encounters.get(tile, DEFAULT_ENCOUNTERS))
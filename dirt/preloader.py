@@ -0,0 +1,77 @@
+"""
+The preloader module reads and decodes assets in the background.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dirt.utils import asset_cache, get_asset_loader
+
+class Preloader(object):
+    """
+    A Preloader reads and decodes mod images and sounds on a pool of
+    worker threads, then hands them to the asset cache on the main thread
+    so that later calls to :func:`dirt.utils.load_image` and
+    :func:`dirt.utils.load_sound` find them ready.
+
+    Queue up the assets, then keep calling :meth:`poll` (for example,
+    while drawing a loading screen) until everything is done:
+
+        preloader = Preloader()
+        preloader.preload_image('data/rat.png')
+        preloader.preload_sound('data/blow.wav')
+
+        while not preloader.is_done():
+            preloader.poll()
+            done, total = preloader.get_progress()
+            ...draw a loading bar...
+
+    Assets which fail to load are skipped; loading them again later
+    raises the error on the main thread as usual.
+    """
+    def __init__(self, workers=4):
+        """Create a new Preloader with WORKERS threads."""
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+        # Maps each asset key to a tuple (future, size_of) for assets
+        # which have not been handed to the asset cache yet.
+        self.pending = {}
+
+        self.done = 0
+        self.total = 0
+
+    def _preload(self, kind, path):
+        key, load, size_of = get_asset_loader(kind, path)
+        if key in asset_cache or key in self.pending:
+            return
+
+        self.pending[key] = (self.executor.submit(load), size_of)
+        self.total += 1
+
+    def preload_image(self, path):
+        "Start loading the mod image PATH in the background."
+        self._preload('image', path)
+
+    def preload_sound(self, path):
+        "Start loading the mod sound PATH in the background."
+        self._preload('sound', path)
+
+    def poll(self):
+        "Hand all the assets which have finished loading to the asset cache."
+        for key, (future, size_of) in list(self.pending.items()):
+            if future.done():
+                del self.pending[key]
+                self.done += 1
+
+                if future.exception() is None:
+                    asset = future.result()
+                    asset_cache.put(key, asset, size_of(asset))
+
+    def get_progress(self):
+        "Return a tuple (done, total) of how many assets have been loaded."
+        return self.done, self.total
+
+    def is_done(self):
+        "Return whether all the queued assets have been loaded."
+        return not self.pending
+
+    def shutdown(self):
+        "Stop the worker threads."
+        self.executor.shutdown(wait=False)
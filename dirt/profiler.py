@@ -0,0 +1,177 @@
+"""
+The profiler module measures where the time of each frame goes.
+"""
+import json
+import time
+from collections import deque
+
+# The name of spans during which the game waits for something to happen.
+# Their time is not counted as work.
+IDLE = 'idle'
+
+class FrameProfiler(object):
+    """
+    A FrameProfiler times named spans of each frame and keeps the timings
+    of the last *history* frames, for an on-screen overlay, and of the
+    last *trace_spans* spans, for exporting to a Chrome trace.
+
+    Call :meth:`begin_frame` and :meth:`end_frame` around each frame, and
+    :meth:`begin` and :meth:`end` (or :meth:`span`) around its phases:
+
+        profiler = FrameProfiler()
+
+        # Main loop
+        while True:
+            profiler.begin_frame()
+
+            profiler.begin('world')
+            ...draw the world...
+            profiler.end('world')
+
+            with profiler.span(IDLE):
+                ...wait for input...
+
+            profiler.end_frame()
+
+    A frame's time is the time between :meth:`begin_frame` and
+    :meth:`end_frame`, less the time spent in :data:`IDLE` spans.
+
+    :ivar bool overlay_enabled: whether the overlay should be drawn
+    """
+    def __init__(self, history=120, trace_spans=100000):
+        """Create a new FrameProfiler."""
+        self.history = history
+        self.overlay_enabled = False
+        self.font = None
+
+        # The time of each frame, and the total time of each span in each
+        # frame, in seconds, oldest first.
+        self.frame_times = deque(maxlen=history)
+        self.span_times = {}
+
+        # Finished spans as (name, start, duration) tuples, in seconds.
+        self.trace = deque(maxlen=trace_spans)
+
+        self.origin = time.perf_counter()
+        self.frame_start = None
+        self.started = {}
+        self.totals = {}
+
+    def begin_frame(self):
+        "Start timing a new frame."
+        self.frame_start = time.perf_counter()
+        self.totals = {}
+
+    def end_frame(self):
+        "Finish timing the current frame."
+        now = time.perf_counter()
+        duration = now - self.frame_start
+        self.trace.append(('frame', self.frame_start, duration))
+        self.frame_times.append(duration - self.totals.get(IDLE, 0.0))
+
+        for name in self.totals:
+            if name not in self.span_times:
+                self.span_times[name] = deque(maxlen=self.history)
+        for name, times in self.span_times.items():
+            times.append(self.totals.get(name, 0.0))
+
+    def begin(self, name):
+        "Start timing the span NAME."
+        self.started[name] = time.perf_counter()
+
+    def end(self, name):
+        "Finish timing the span NAME."
+        now = time.perf_counter()
+        start = self.started.pop(name)
+        self.trace.append((name, start, now - start))
+        self.totals[name] = self.totals.get(name, 0.0) + now - start
+
+    def span(self, name):
+        "Return a context manager which times the span NAME."
+        return _Span(self, name)
+
+    def average(self, name=None):
+        """
+        Return the average time of the span NAME per frame, or of whole
+        frames if NAME is None, in milliseconds.
+        """
+        times = self.frame_times if name is None else self.span_times.get(name, ())
+        if not times:
+            return 0.0
+        return sum(times) / len(times) * 1000
+
+    def percentile(self, fraction):
+        "Return the frame time that FRACTION of frames beat, in milliseconds."
+        if not self.frame_times:
+            return 0.0
+        times = sorted(self.frame_times)
+        return times[int(fraction * (len(times) - 1))] * 1000
+
+    def histogram(self, bucket_ms=2.5, buckets=10):
+        """
+        Return how many recent frames took each BUCKET_MS milliseconds
+        long range of time, as a list of BUCKETS counts.  The last bucket
+        also counts every slower frame.
+        """
+        counts = [0] * buckets
+        for duration in self.frame_times:
+            counts[min(int(duration * 1000 / bucket_ms), buckets - 1)] += 1
+        return counts
+
+    def overlay_lines(self):
+        "Return the lines of text that the overlay shows."
+        lines = ['frame %5.1f ms  p95 %5.1f' % (self.average(),
+                                                 self.percentile(0.95))]
+        for name in sorted(self.span_times):
+            if name != IDLE:
+                lines.append('%-8s %5.1f ms' % (name, self.average(name)))
+        return lines
+
+    def draw(self, window, rect):
+        "Draw the overlay onto WINDOW, in RECT."
+        import pygame
+        from dirt.utils import draw_text
+
+        if self.font is None:
+            self.font = pygame.font.Font(None, 16)
+
+        rect = pygame.Rect(rect)
+        overlay = pygame.Surface(rect.size)
+        overlay.set_alpha(192)
+        window.blit(overlay, rect.topleft)
+
+        draw_text(self.font, '\n'.join(self.overlay_lines()), (0, 255, 0),
+                  window, rect.x + 4, rect.y + 4)
+
+        # Draw the histogram of frame times along the bottom.
+        counts = self.histogram()
+        width = (rect.width - 8) // len(counts)
+        for i, count in enumerate(counts):
+            height = 30 * count // max(len(self.frame_times), 1)
+            window.fill((255, 255, 0) if i < len(counts) - 1 else (255, 0, 0),
+                        (rect.x + 4 + i * width, rect.bottom - 4 - height,
+                         width - 1, height))
+
+    def export_chrome_trace(self, path):
+        """
+        Write the recorded spans to PATH as a Chrome trace, which can be
+        opened in chrome://tracing or Perfetto.
+        """
+        events = [{'name': name, 'ph': 'X', 'pid': 1, 'tid': 1,
+                   'ts': (start - self.origin) * 1e6, 'dur': duration * 1e6}
+                  for name, start, duration in self.trace]
+
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+class _Span(object):
+    "A context manager which times a span of a FrameProfiler."
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.begin(self.name)
+
+    def __exit__(self, *exc_info):
+        self.profiler.end(self.name)
@@ -0,0 +1,125 @@
+"""
+The replay module records games and plays them back.
+
+A replay holds the seed of the random number generator and the input
+events of each frame.  Since everything random in the game comes from
+the seeded :mod:`random` module, playing the same events on the same
+frames plays the same game again.  That makes replays useful as repro
+cases for bugs and as benchmarks that always do the same work.
+
+Replay files start with a header (magic, version and seed), followed by
+one fixed-size record per input event: the frame number, the kind of
+event, the key, the modifier keys and a value.  Frames without input
+take up no space.  The last record marks the end of the game and holds
+a checksum of the final game state, so that a replay which no longer
+plays out the same way can be noticed.
+"""
+import struct
+import zlib
+import pygame
+
+# The header of a replay: magic, version and seed.
+_MAGIC = b'DIRTRPLY'
+_VERSION = 1
+_header = struct.Struct('<8sHQ')
+
+# A replay record: frame, kind, key, modifier keys and value.  The value
+# is the typed character for key presses and the checksum of the game
+# state for the end of the game.
+_record = struct.Struct('<IBIHI')
+
+# Kinds of replay records.
+_KIND_END     = 0
+_KIND_KEYDOWN = 1
+_KIND_QUIT    = 2
+
+def state_checksum(state):
+    "Return a checksum of the player's side of the GameState STATE."
+    player = state.player
+    summary = (player.x, player.y, player.facing, player.health,
+               player.money, player.is_in_battle(), state.time)
+    return zlib.crc32(repr(summary).encode('utf-8'))
+
+class ReplayRecorder(object):
+    """
+    A ReplayRecorder writes the input of a game to a replay file.
+
+    :ivar int seed: the seed of the game being recorded
+    """
+    def __init__(self, path, seed):
+        """Start recording a game played with SEED to the file PATH."""
+        self.seed = seed
+        self.file = open(path, 'wb')
+        self.file.write(_header.pack(_MAGIC, _VERSION, seed))
+
+    def record(self, frame, events):
+        "Record the EVENTS handled on frame number FRAME."
+        for event in events:
+            if event.type == pygame.KEYDOWN:
+                value = ord(event.unicode) if len(event.unicode) == 1 else 0
+                self.file.write(_record.pack(frame, _KIND_KEYDOWN, event.key,
+                                             event.mod & 0xffff, value))
+            elif event.type == pygame.QUIT:
+                self.file.write(_record.pack(frame, _KIND_QUIT, 0, 0, 0))
+
+    def finish(self, frame, checksum):
+        "End the recording on frame number FRAME with the state CHECKSUM."
+        self.file.write(_record.pack(frame, _KIND_END, 0, 0, checksum))
+        self.file.close()
+
+class ReplayPlayer(object):
+    """
+    A ReplayPlayer hands out the input events of a replay file, frame by
+    frame.
+
+    :ivar int seed: the seed of the recorded game
+    :ivar int end_frame: the number of the last frame of the game
+    :ivar int checksum: the checksum of the game state at the end
+    """
+    def __init__(self, path):
+        """Load the replay file at PATH."""
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        if len(data) < _header.size:
+            raise ValueError('Truncated replay header')
+
+        magic, version, self.seed = _header.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError('Not a replay: %s' % path)
+        if version != _VERSION:
+            raise ValueError('Unsupported replay version: %d' % version)
+
+        # Maps frame numbers to the events of the frame.
+        self.frames = {}
+
+        self.end_frame = None
+        self.checksum = None
+
+        for offset in range(_header.size, len(data) - _record.size + 1,
+                            _record.size):
+            frame, kind, key, mod, value = _record.unpack_from(data, offset)
+
+            if kind == _KIND_KEYDOWN:
+                event = pygame.event.Event(pygame.KEYDOWN, key=key, mod=mod,
+                                           unicode=chr(value) if value else '')
+            elif kind == _KIND_QUIT:
+                event = pygame.event.Event(pygame.QUIT)
+            else:
+                self.end_frame = frame
+                self.checksum = value
+                break
+
+            self.frames.setdefault(frame, []).append(event)
+
+        if self.end_frame is None:
+            # The recording was cut off; play what there is.
+            self.end_frame = max(self.frames) if self.frames else 0
+
+    def events(self, frame):
+        "Return the input events of frame number FRAME."
+        return self.frames.get(frame, [])
+
+    def is_over(self, frame):
+        "Return whether frame number FRAME is the last one of the replay."
+        return frame >= self.end_frame
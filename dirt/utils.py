@@ -1,23 +1,76 @@
 import os
 import json
 import math
-import pygame
 import appdirs
-from pkg_resources import resource_stream, resource_exists
+import posixpath
+import pathlib
+from .assetcache import AssetCache
+from .bundle import BUNDLE_EXTENSION, ModBundle
+
+try:
+    from importlib.resources import files as _package_files
+except ImportError:
+    # Before Python 3.9, there is no importlib.resources.files, but the
+    # packaged resources are plain files next to this module anyway.
+    _package_files = None
 
 # Given to methods in the appdirs module
 _APPNAME = 'dirt'
 _APPAUTHOR = None
 
+# The root of the packaged resources, found when it is first needed.
+_package_root = None
+
+# The user's and the system's data directories, in shadowing order.
+# These are looked up once, when they are first needed.
+_data_dirs = None
+
+# Where each resource that has been opened lives.  A location is a tuple
+# ('file', full path), ('package', path inside the dirt package) or
+# ('bundle', (path to a mod bundle, name of the member)).
+_locations = {}
+
+# The mod bundles that have been opened, by their paths.
+_bundles = {}
+
+# The location of every file in the registered mods, by its path relative
+# to the mod.  Files in later mods shadow the ones in earlier mods.
+_mod_index = {}
+
+# The location of every file in each registered mod, by the mod's name.
+_mod_indexes = {}
+
+# Whether game objects load images, sounds and fonts.  Headless
+# simulations turn this off so that the game runs without pygame.
+media_enabled = True
+
+# Decoded images and sounds, by where they were loaded from.
+asset_cache = AssetCache()
+
+# Rendered lines of text, by font, text, color and antialiasing.
+text_cache = AssetCache(max_bytes=4 * 1024 * 1024)
+
 # This array is used by the image/sound/etc loading functions
 _mods = []
 
+def render_text(font, text, color, antialias=True):
+    """
+    Return a surface with the line TEXT rendered in FONT with COLOR.
+
+    Rendered text is cached, so the surface is shared and must not be
+    drawn on.
+    """
+    color = tuple(color)
+    return text_cache.get((font, text, color, antialias),
+                          lambda: font.render(text, antialias, color),
+                          _surface_size)
+
 def draw_text(font, text, color, window, x, y):
     "Draw TEXT in FONT with COLOR onto WINDOW at (X, Y)."
     cursor = 0
 
     for line in text.split('\n'):
-        surf = font.render(line, True, color)
+        surf = render_text(font, line, color)
         window.blit(surf, (x, y + cursor))
         cursor += font.get_linesize()
 
@@ -37,6 +90,57 @@ def game_time_to_string(time):
 
     return str(hour) + ":" + ("%02d" % (time % 60, )) + ' ' + indicator
 
+def _get_data_dirs():
+    "Return the user's and the system's data directories."
+    global _data_dirs, _APPNAME, _APPAUTHOR
+
+    if _data_dirs is None:
+        _data_dirs = (appdirs.user_data_dir(_APPNAME, _APPAUTHOR),
+                      appdirs.site_data_dir(_APPNAME, _APPAUTHOR))
+    return _data_dirs
+
+def _packaged(path):
+    "Return a traversable object for the packaged resource PATH."
+    global _package_root
+
+    if _package_root is None:
+        if _package_files is not None:
+            _package_root = _package_files('dirt')
+        else:
+            _package_root = pathlib.Path(os.path.dirname(os.path.abspath(__file__)))
+    return _package_root.joinpath(path)
+
+def _normalize(path):
+    "Return PATH with forward slashes and without redundant parts."
+    return posixpath.normpath(path.replace(os.sep, '/'))
+
+def _locate(path):
+    "Find out where the resource PATH lives, or return None."
+    # Resources in the ~/.local/share/dirt or AppData folder should shadow
+    # the packaged resources, and so should system-wide ones.
+    for data_dir in _get_data_dirs():
+        full_path = os.path.join(data_dir, path)
+        if os.path.isfile(full_path):
+            return ('file', full_path)
+
+    # It wasn't found in the user's directories,
+    # so we just use the packaged resource.
+    if _packaged(path).is_file():
+        return ('package', path)
+
+    # Couldn't find it :/
+    return None
+
+def _open_location(location):
+    "Return a stream to the resource at LOCATION."
+    kind, where = location
+    if kind == 'file':
+        return open(where, 'rb')
+    elif kind == 'bundle':
+        bundle_path, name = where
+        return _bundles[bundle_path].open(name)
+    return _packaged(where).open('rb')
+
 def get_resource_stream(path):
     """
     Return a stream to the contents of a named resource.
@@ -44,40 +148,167 @@ def get_resource_stream(path):
     :param path: the path to the resource
     :returns: a file-like stream to the resource
     """
-    global _APPNAME, _APPAUTHOR
-    
-    # Resources in the ~/.local/share/dirt or AppData folder should shadow
-    # the packaged resources.
-    f = None
-    try:
-        full_path = os.path.join(appdirs.user_data_dir(_APPNAME, _APPAUTHOR), path)
-        f = open(full_path, 'rb')
-        return f
-    except FileNotFoundError:
-        pass
-    
-    # Not in the local one... How about system-wide?
-    try:
-        full_path = os.path.join(appdirs.site_data_dir(_APPNAME, _APPAUTHOR), path)
-        f = open(full_path, 'rb')
-        return f
-    except FileNotFoundError:
-        pass
-    
-    # It wasn't found in the user's directories,
-    # so we just use the packaged resource.
-    if resource_exists('dirt', path):
-        return resource_stream('dirt', path)
-    
-    # Couldn't find it :/
+    path = _normalize(path)
+    location = _locations.get(path)
+
+    if location is not None:
+        try:
+            return _open_location(location)
+        except FileNotFoundError:
+            # It was removed since we found it.
+            del _locations[path]
+
+    location = _locate(path)
+    if location is None:
+        return None
+
+    _locations[path] = location
+    return _open_location(location)
+
+def _list_package_files(path):
+    "Yield the paths of all files under the packaged directory PATH."
+    for entry in _packaged(path).iterdir():
+        child = path + '/' + entry.name
+        if entry.is_dir():
+            for grandchild in _list_package_files(child):
+                yield grandchild
+        else:
+            yield child
+
+def _index_bundle(index, bundle_path):
+    "Add the location of every member of a mod bundle to INDEX."
+    bundle = _bundles.get(bundle_path)
+    if bundle is None:
+        bundle = _bundles[bundle_path] = ModBundle(bundle_path)
+
+    for name in bundle.names:
+        index[_normalize(name)] = ('bundle', (bundle_path, name))
+
+def _index_mod(mod_name):
+    """
+    Return the location of every file in a mod, by its path relative
+    to the mod.
+
+    A mod can be a directory, a bundle (see :mod:`dirt.bundle`) or both,
+    in which case the files in the directory shadow those in the bundle.
+    """
+    prefix = 'mods/' + mod_name
+    index = {}
+
+    # Index the packaged files first so that the system's and then the
+    # user's files can shadow them.
+    # Bundles are memory-mapped, so only packaged bundles which are real
+    # files can be used.
+    bundle = _packaged(prefix + BUNDLE_EXTENSION)
+    if isinstance(bundle, pathlib.Path) and bundle.is_file():
+        _index_bundle(index, str(bundle))
+
+    if _packaged(prefix).is_dir():
+        for path in _list_package_files(prefix):
+            index[path[len(prefix) + 1:]] = ('package', path)
+
+    for data_dir in reversed(_get_data_dirs()):
+        root = os.path.join(data_dir, 'mods', mod_name)
+
+        if os.path.isfile(root + BUNDLE_EXTENSION):
+            _index_bundle(index, root + BUNDLE_EXTENSION)
+
+        for dirpath, dirnames, filenames in os.walk(root):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                index[_normalize(os.path.relpath(full_path, root))] = \
+                  ('file', full_path)
+
+    return index
+
+def rescan_mods():
+    """
+    Forget where all resources live and index the registered mods again.
+
+    This must be called after files are added to or removed from the
+    mod directories while the game is running.
+    """
+    global _mod_index
+
+    _locations.clear()
+    _bundles.clear()
+    asset_cache.clear()
+
+    _mod_index = {}
+    for mod_name in reversed(_mods):
+        _mod_indexes[mod_name] = _index_mod(mod_name)
+        _mod_index.update(_mod_indexes[mod_name])
+
+def _bundle_location(bundle_path, path):
+    "Return the location of PATH in the opened mod bundle BUNDLE_PATH, or None."
+    bundle = _bundles.get(bundle_path)
+    if bundle is not None:
+        for name in bundle.names:
+            if _normalize(name) == path:
+                return ('bundle', (bundle_path, name))
     return None
-    
+
+def _locate_in_mod(mod_name, path):
+    """
+    Find out where the file PATH of a mod lives, or return None, the same
+    way that :func:`_index_mod` would.
+    """
+    for data_dir in _get_data_dirs():
+        root = os.path.join(data_dir, 'mods', mod_name)
+        full_path = os.path.join(root, path)
+        if os.path.isfile(full_path):
+            return ('file', full_path)
+
+        location = _bundle_location(root + BUNDLE_EXTENSION, path)
+        if location is not None:
+            return location
+
+    prefix = 'mods/' + mod_name
+    if _packaged(prefix + '/' + path).is_file():
+        return ('package', prefix + '/' + path)
+    return _bundle_location(str(_packaged(prefix + BUNDLE_EXTENSION)), path)
+
+def update_user_resource(path):
+    """
+    Take note that the file PATH in the user's data directory (see
+    :func:`get_user_resource_path`) was written or removed.
+
+    Only that file's entries are looked up again, so unlike
+    :func:`rescan_mods` this keeps the mod index and the asset cache.
+    """
+    path = _normalize(path)
+    _locations.pop(path, None)
+
+    parts = path.split('/', 2)
+    if len(parts) < 3 or parts[0] != 'mods' or parts[1] not in _mod_indexes:
+        return
+    mod_name, mod_path = parts[1], parts[2]
+
+    index = _mod_indexes[mod_name]
+    location = _locate_in_mod(mod_name, mod_path)
+    if location is None:
+        index.pop(mod_path, None)
+    else:
+        index[mod_path] = location
+
+    # The file comes from the last registered mod which has it.
+    for name in _mods:
+        location = _mod_indexes[name].get(mod_path)
+        if location is not None:
+            _mod_index[mod_path] = location
+            break
+    else:
+        _mod_index.pop(mod_path, None)
+
 def register_mod(mod_name):
     global _mods
     _mods = [mod_name] + _mods
+    index = _index_mod(mod_name)
+    _mod_indexes[mod_name] = index
+    _mod_index.update(index)
     
     cfg = None
-    with get_resource_stream(os.path.join('mods', mod_name, 'config.json')) as f:
+    with _open_location(index['config.json']) as f:
         cfg = json.loads(f.read().decode('utf-8'))
     print('Registered mod: "%s" by %s' % (cfg['title'], cfg['author']))
     
@@ -94,20 +325,80 @@ def get_user_resource_path(path):
     global _APPNAME, _APPAUTHOR
     return os.path.join(appdirs.user_data_dir(_APPNAME, _APPAUTHOR), path)
 
+def _find_mod_location(path):
+    "Return where the mod resource PATH lives, or None if no mod has it."
+    return _mod_index.get(_normalize(path))
+
+def find_mod_resource(path):
+    """
+    Return a stream to a resource in the first registered mod which has it.
+
+    :param path: the path to the resource, relative to the mod
+    :returns: a file-like stream to the resource, or None if no mod has it
+    """
+    location = _find_mod_location(path)
+    if location is None:
+        return None
+
+    try:
+        return _open_location(location)
+    except FileNotFoundError:
+        # It was removed since the mods were indexed.
+        rescan_mods()
+        return find_mod_resource(path)
+
 def get_mod_resource(path):
-    for mod_name in _mods:
-        p = os.path.join('mods', mod_name, path)
-        res = get_resource_stream(p)
-        if res is not None:
-            return res
-    
-    # Couldn't find the resource...
-    raise Exception('Couldn\'t find the mod resource: %s' % path)
+    res = find_mod_resource(path)
+    if res is None:
+        # Couldn't find the resource...
+        raise Exception('Couldn\'t find the mod resource: %s' % path)
+    return res
+
+def get_asset_loader(kind, path):
+    """
+    Return what is needed to load the mod image or sound PATH.
+
+    :param str kind: either 'image' or 'sound'
+    :param str path: the path to the resource, relative to the mod
+    :returns: a tuple (key, load, size_of), where key is the asset's key
+              in the asset cache, load() reads and decodes the asset and
+              size_of(asset) returns roughly how many bytes it takes up
+    """
+    location = _find_mod_location(path)
+    if location is None:
+        # Couldn't find the resource...
+        raise Exception('Couldn\'t find the mod resource: %s' % path)
+
+    import pygame
+
+    if kind == 'image':
+        decode = lambda f: pygame.image.load(f, path)
+        size_of = _surface_size
+    else:
+        decode = lambda f: pygame.mixer.Sound(file=f)
+        size_of = _sound_size
+
+    def load():
+        with _open_location(location) as f:
+            return decode(f)
+
+    return (kind, location), load, size_of
+
+def _surface_size(surface):
+    "Return roughly how many bytes SURFACE takes up."
+    return surface.get_pitch() * surface.get_height()
+
+def _sound_size(sound):
+    "Return roughly how many bytes SOUND takes up."
+    import pygame
+    mixer = pygame.mixer.get_init()
+    if mixer is None:
+        return 0
+    frequency, size, channels = mixer
+    return int(sound.get_length() * frequency * channels * abs(size) // 8)
 
 def load_image(path):
-    with get_mod_resource(path) as f:
-        return pygame.image.load(f, path)
+    return asset_cache.get(*get_asset_loader('image', path))
     
 def load_sound(path):
-    with get_mod_resource(path) as f:
-        return pygame.mixer.Sound(file=f)
+    return asset_cache.get(*get_asset_loader('sound', path))
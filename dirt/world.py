@@ -1,17 +1,45 @@
-import pygame
 import os
-import json
-from .utils import get_resource_stream, get_user_resource_path, get_mod_resource
+from array import array
+from .chunks import ChunkedTiles
+from .mapformat import TILE_TYPECODE, JOURNAL_SUFFIX, is_binary_map, \
+                       read_binary_map, read_json_map, read_journal, \
+                       write_binary_map, write_json_map, write_journal
+from .utils import get_user_resource_path, get_mod_resource, find_mod_resource, update_user_resource
+
+# Saving a map appends the edits since the last save to a journal next
+# to it.  Once the journal holds this many edits, the whole map is
+# rewritten instead and the journal is removed.
+COMPACT_JOURNAL_EDITS = 4096
+
+# Maps with at least this many tiles, such as 1000x1000 maps, are
+# streamed in chunks instead of being kept in memory all at once.
+CHUNKED_MAP_TILES = 512 * 512
 
 class World(object):
-    def __init__(self):
+    def __init__(self, chunk_size=64, chunk_cache_bytes=16 * 1024 * 1024):
+        # How big maps are split into chunks, and how many bytes of
+        # unchanged chunks are kept in memory.
+        self.chunk_size = chunk_size
+        self.chunk_cache_bytes = chunk_cache_bytes
+
         self.width = 0
         self.height = 0
-        self.tiles = []
+        self.tiles = array(TILE_TYPECODE)
         self.bgm_path = 'magictown.ogg'
         self.day_sky_prefix = 'day'
         self.night_sky_prefix = 'sky'
 
+        # Bumped whenever the tiles change, so that views of the world
+        # can tell when they are out of date.
+        self.revision = 0
+
+        # The tiles that changed since the map was last saved, the path
+        # it was saved to and the metadata and journal length at the time.
+        self.edits = set()
+        self.saved_path = None
+        self.saved_metadata = None
+        self.journal_edits = 0
+
     def at(self, x, y):
         if x < 0 or y < 0 or x >= self.width or y >= self.height:
             raise ValueError('Tried to access tile (%d, %d) in %dx%d map' % (x, y, self.width, self.height))
@@ -21,37 +49,143 @@ class World(object):
         if x < 0 or y < 0 or x >= self.width or y >= self.height:
             raise ValueError('Tried to access tile (%d, %d) in %dx%d map' % (x, y, self.width, self.height))
         self.tiles[y*self.width + x] = num
+        self.edits.add((x, y))
+        self.revision += 1
+
+    def row(self, y):
+        "Return a copy of the tiles in row Y."
+        if y < 0 or y >= self.height:
+            raise ValueError('Tried to access row %d in %dx%d map' % (y, self.width, self.height))
+        start = y * self.width
+        return array(TILE_TYPECODE, self.tiles[start:start + self.width])
+
+    def rect(self, x, y, width, height):
+        "Return a copy of the tiles in a rectangle, row by row."
+        if x < 0 or y < 0 or width < 0 or height < 0 or \
+           x + width > self.width or y + height > self.height:
+            raise ValueError('Tried to access %dx%d rect at (%d, %d) in %dx%d map' % (width, height, x, y, self.width, self.height))
+        tiles = array(TILE_TYPECODE)
+        for row_y in range(y, y + height):
+            start = row_y * self.width + x
+            tiles.extend(self.tiles[start:start + width])
+        return tiles
+
+    def cells(self, x, y, offsets):
+        """
+        Return the tiles at (X + dx, Y + dy) for every (dx, dy) in OFFSETS.
+        Tiles outside the map are None.
+        """
+        width = self.width
+        height = self.height
+        tiles = self.tiles
+        result = []
+        for dx, dy in offsets:
+            pos_x = x + dx
+            pos_y = y + dy
+            if 0 <= pos_x < width and 0 <= pos_y < height:
+                result.append(tiles[pos_y*width + pos_x])
+            else:
+                result.append(None)
+        return result
 
     def newmap(self, width, height):
         self.width = width
         self.height = height
-        self.tiles = [0] * width * height
+        if width * height >= CHUNKED_MAP_TILES:
+            self.tiles = self._chunk(width, height, None)
+        else:
+            self.tiles = array(TILE_TYPECODE, bytes(width * height))
+        self.edits = set()
+        self.saved_path = None
+        self.revision += 1
+
+    def _chunk(self, width, height, source):
+        "Return a ChunkedTiles for a map, using this world's settings."
+        return ChunkedTiles(width, height, source,
+                            chunk_size=self.chunk_size,
+                            cache_bytes=self.chunk_cache_bytes)
 
     def load(self, filename):
         with get_mod_resource(filename) as f:
-            j = json.loads(f.read().decode('utf-8'))
+            if is_binary_map(filename):
+                width, height, tiles, metadata = read_binary_map(f)
+            else:
+                width, height, tiles, metadata = read_json_map(f)
 
-        self.width = j['width']
-        self.height = j['height']
-        self.tiles = j['tiles']
-        self.bgm_path = j['bgm']
-        self.day_sky_prefix = j['day_sky_prefix']
-        self.night_sky_prefix = j['night_sky_prefix']
+        if width * height >= CHUNKED_MAP_TILES:
+            # Only binary maps can be memory-mapped; JSON maps have to be
+            # read into memory whole before they are split into chunks.
+            if not is_binary_map(filename):
+                print('Warning: %s is a %dx%d JSON map, which is loaded into '
+                      'memory all at once; convert it to a .dmap map with '
+                      'tools/convert_map.py to stream it instead'
+                      % (filename, width, height))
+            tiles = self._chunk(width, height, tiles)
 
-        # Play the world's music.
-        pygame.mixer.music.load(get_mod_resource(os.path.join('data', self.bgm_path)))
-        pygame.mixer.music.play(loops=-1)
+        self.width = width
+        self.height = height
+        self.tiles = tiles
+        self.bgm_path = metadata['bgm']
+        self.day_sky_prefix = metadata['day_sky_prefix']
+        self.night_sky_prefix = metadata['night_sky_prefix']
+
+        # Replay the edits that were saved since the map was last compacted.
+        journal = find_mod_resource(filename + JOURNAL_SUFFIX)
+        if journal is not None:
+            with journal as f:
+                for x, y, num in read_journal(f):
+                    self.tiles[y*width + x] = num
+
+        self.edits = set()
+        self.saved_path = None
+        self.revision += 1
 
     def save(self, filename):
-        j = {
-            'width': self.width,
-            'height': self.height,
+        """
+        Save the map to FILENAME in the user's data directory.
+
+        If the map was last saved to the same file, only the tiles which
+        changed since then are appended to the file's edit journal.
+        Otherwise, or once the journal has grown long, the whole map is
+        written out and the journal is removed.
+        """
+        metadata = {
             'bgm': self.bgm_path,
             'day_sky_prefix': self.day_sky_prefix,
-            'night_sky_prefix': self.night_sky_prefix,
-            'tiles': self.tiles
+            'night_sky_prefix': self.night_sky_prefix
         }
-        
-        f = open(get_user_resource_path(filename), 'w')
-        json.dump(j, f)
-        f.close()
+
+        path = get_user_resource_path(filename)
+        journal_path = path + JOURNAL_SUFFIX
+
+        if path == self.saved_path and metadata == self.saved_metadata and \
+           self.journal_edits + len(self.edits) < COMPACT_JOURNAL_EDITS:
+            edits = [(x, y, self.tiles[y*self.width + x])
+                     for x, y in sorted(self.edits)]
+            with open(journal_path, 'ab') as f:
+                write_journal(f, edits)
+            self.journal_edits += len(edits)
+            self.edits = set()
+            update_user_resource(filename + JOURNAL_SUFFIX)
+            return
+
+        # Write to a temporary file first, since the tiles might be
+        # memory-mapped from the very file that is being replaced.
+        tmp_path = path + '.tmp'
+        if is_binary_map(filename):
+            with open(tmp_path, 'wb') as f:
+                write_binary_map(f, self.width, self.height, self.tiles, metadata)
+        else:
+            with open(tmp_path, 'w') as f:
+                write_json_map(f, self.width, self.height, self.tiles, metadata)
+        os.replace(tmp_path, path)
+
+        if os.path.exists(journal_path):
+            os.remove(journal_path)
+        update_user_resource(filename)
+        update_user_resource(filename + JOURNAL_SUFFIX)
+
+        self.edits = set()
+        self.saved_path = path
+        self.saved_metadata = metadata
+        self.journal_edits = 0
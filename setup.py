@@ -7,6 +7,7 @@ setup(
     license='GPLv3',
     packages=find_packages(),
     install_requires=['pygame==1.9.3', 'appdirs==1.4.3'],
+    extras_require={'sim': ['numpy']},
     include_package_data=True,
     entry_points={
         'console_scripts': [
@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+# convert_map.py - convert maps between the JSON and binary formats
+#
+# Usage: convert_map.py <source> <destination>
+#
+# The format of each map is decided by its extension: ".dmap" files are
+# binary maps and everything else is JSON.
+import sys
+from dirt.mapformat import convert_map
+
+if len(sys.argv) != 3:
+    print('usage: %s <source> <destination>' % sys.argv[0])
+    sys.exit(1)
+
+convert_map(sys.argv[1], sys.argv[2])
@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+# pack_mod.py - pack a mod directory into a single-file mod bundle
+#
+# Usage: pack_mod.py <mod directory> <bundle>
+#
+# Put the bundle next to where the mod directory would go and name it
+# after the mod, e.g. dirt/mods/default.dirtpak for the "default" mod.
+import sys
+from dirt.bundle import pack_mod
+
+if len(sys.argv) != 3:
+    print('usage: %s <mod directory> <bundle>' % sys.argv[0])
+    sys.exit(1)
+
+pack_mod(sys.argv[1], sys.argv[2])
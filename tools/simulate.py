@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# simulate.py - play many sessions of the game at once and report how they went
+#
+# Usage: simulate.py [fight|talk] [sessions] [steps] [seed]
+#
+# Needs NumPy.  Every session starts where a new game does and plays the
+# castle map by the script described in dirt.batchsim.
+import sys
+import time
+from dirt import utils
+from dirt.batchsim import BatchSimulation
+from dirt.game import load_mods
+from dirt.world import World
+
+if len(sys.argv) > 5:
+    print('usage: %s [fight|talk] [sessions] [steps] [seed]' % sys.argv[0])
+    sys.exit(1)
+
+policy = sys.argv[1] if len(sys.argv) > 1 else 'fight'
+sessions = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+steps = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+seed = int(sys.argv[4]) if len(sys.argv) > 4 else None
+
+utils.media_enabled = False
+tile_kinds = load_mods()
+world = World()
+world.load('data/castle.json')
+
+start = time.perf_counter()
+sim = BatchSimulation(world, tile_kinds, sessions, policy=policy, seed=seed)
+sim.run(steps)
+elapsed = time.perf_counter() - start
+
+stats = sim.stats()
+print('%d sessions, %d steps, %.1f s' % (sessions, sim.steps, elapsed))
+print('survival rate: %.2f%%' % (stats['survival_rate'] * 100))
+print('minutes played: %.1f' % stats['mean_minutes'])
+print('battles fought: %.2f' % stats['mean_battles'])
+print("survivors' money: %.2f" % stats['mean_money'])
+for name, count in stats['encounters'].items():
+    print('%-12s met %9d times, killed %9d players' %
+          (name, count, stats['deaths'][name]))